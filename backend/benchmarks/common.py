@@ -0,0 +1,102 @@
+"""Shared helpers for the backend benchmarks (seeding and latency stats)."""
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "fincontrol_bench")
+# The load generator is one client hammering one IP; measure the app, not the limiter
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+CATEGORIAS = {
+    "entrada": {"Salário": ["Salário Principal"], "Freelance": ["Serviços", "Consultoria"]},
+    "saida": {
+        "Alimentação": ["Supermercado", "Restaurante", "Delivery"],
+        "Transporte": ["Combustível", "Uber/Taxi"],
+        "Moradia": ["Aluguel", "Luz", "Internet"],
+        "Lazer": ["Streaming", "Cinema"],
+    },
+}
+PAYMENT_METHODS = ["dinheiro", "credito", "debito", "pix"]
+PASSWORD = "BenchPass123!"
+
+
+def transaction_payload(rng, start=date(2015, 1, 1), days=3650):
+    # A TransactionCreate body, as the API receives it
+    tipo = "entrada" if rng.random() < 0.2 else "saida"
+    categoria = rng.choice(list(CATEGORIAS[tipo]))
+    return {
+        "tipo": tipo,
+        "categoria": categoria,
+        "subcategoria": rng.choice(CATEGORIAS[tipo][categoria]),
+        "valor": round(rng.uniform(5, 5000), 2),
+        "descricao": f"{categoria} #{rng.randrange(10_000)}",
+        "data": (start + timedelta(days=rng.randrange(days))).isoformat(),
+        "payment_method": rng.choice(PAYMENT_METHODS),
+        "is_paid": True,
+    }
+
+
+def make_transaction(user_id, rng, start=date(2015, 1, 1), days=3650):
+    # The same transaction in its stored form, for direct inserts
+    payload = transaction_payload(rng, start, days)
+    valor_cents = round(payload.pop("valor") * 100)
+    data = datetime.combine(date.fromisoformat(payload.pop("data")), datetime.min.time(), timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        **payload,
+        "valor_cents": valor_cents,
+        "data": data,
+        "created_at": data,
+        "version": 0,
+    }
+
+
+async def seed_transactions(db, user_id, count, batch_size=10_000, seed=42):
+    rng = random.Random(seed)
+    remaining = count
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        await db.transactions.insert_many(
+            [make_transaction(user_id, rng) for _ in range(size)], ordered=False
+        )
+        remaining -= size
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        "runs": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 2) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 2),
+        "p95_ms": round(percentile(samples_ms, 95), 2),
+        "p99_ms": round(percentile(samples_ms, 99), 2),
+    }
+
+
+async def time_async(fn, runs):
+    samples = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples), result
+
+
+async def register(client):
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    response = await client.post("/api/auth/register", json={"name": "Bench", "email": email, "password": PASSWORD})
+    response.raise_for_status()
+    return email, {"Authorization": f"Bearer {response.json()['token']}"}
@@ -0,0 +1,78 @@
+"""Compare the legacy and aggregation-based /api/dashboard/stats.
+
+Seeds one user per size into a scratch database and times both versions:
+
+    cd backend && python -m benchmarks.dashboard_stats --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import seed_transactions, time_async
+
+import server
+
+
+async def legacy_dashboard_stats(db, user_id):
+    # The pre-aggregation implementation, kept here only as the baseline
+    transactions = await db.transactions.find(
+        {"user_id": user_id}, {"_id": 0, "valor_cents": 1, "tipo": 1}
+    ).to_list(5000)
+    goals = await db.goals.find({"user_id": user_id}, {"_id": 0, "id": 1}).to_list(1000)
+
+    today = datetime.now(timezone.utc).date()
+    next_7_days = today + timedelta(days=7)
+    bills = await db.bills.find({"user_id": user_id, "status": "pendente"}, {"_id": 0}).to_list(1000)
+    upcoming_bills = [
+        bill for bill in bills
+        if today <= server.as_date(bill["vencimento"]) <= next_7_days
+    ]
+
+    total_entradas = sum(t["valor_cents"] for t in transactions if t["tipo"] == "entrada") / 100
+    total_saidas = sum(t["valor_cents"] for t in transactions if t["tipo"] == "saida") / 100
+    return {
+        "total_entradas": total_entradas,
+        "total_saidas": total_saidas,
+        "saldo": total_entradas - total_saidas,
+        "transacoes_recentes": len(transactions),
+        "metas_ativas": len(goals),
+        "contas_a_vencer": len(upcoming_bills),
+    }
+
+
+async def run(sizes, runs):
+    db = server.db
+    report = []
+    for size in sizes:
+        user_id = f"bench-dashboard-{size}"
+        await db.transactions.delete_many({"user_id": user_id})
+        await seed_transactions(db, user_id, size)
+        await server.rebuild_rollups(user_id)
+
+        legacy, legacy_result = await time_async(lambda: legacy_dashboard_stats(db, user_id), runs)
+        current, current_result = await time_async(
+            lambda: server.compute_dashboard_stats(user_id, datetime.now(timezone.utc).date()), runs
+        )
+        report.append({
+            "transactions": size,
+            "legacy": legacy,
+            "aggregation": current,
+            "legacy_counted": legacy_result["transacoes_recentes"],
+            "aggregation_counted": current_result.transacoes_recentes,
+        })
+        await db.transactions.delete_many({"user_id": user_id})
+        await db.user_rollups.delete_many({"user_id": user_id})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.sizes, args.runs)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
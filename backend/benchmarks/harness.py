@@ -0,0 +1,272 @@
+"""Reproducible load test of the API, run in-process.
+
+Seeds users with transactions, bills and goals through the API itself, drives
+concurrent scenarios against it and prints throughput and p50/p95/p99 per
+endpoint as JSON. Save a run, then compare later commits against it:
+
+    cd backend && python -m benchmarks.harness --output baseline.json
+    cd backend && python -m benchmarks.harness --compare baseline.json
+
+The app is served through an httpx ASGITransport, against MONGO_URL/DB_NAME
+(the database is dropped first, so its name must contain "bench") or against
+mongomock-motor with --mongomock. mongomock lacks some aggregation operators,
+so analytics endpoints show up as errors there; use it to smoke-test the
+harness, not for numbers.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from benchmarks.common import PASSWORD, summarize, transaction_payload
+
+import server
+
+SEARCH_QUERIES = ["super", "alimentacao", "uber", "salario", "streaming", "mor alu"]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.statuses = {}
+
+    async def call(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.samples.setdefault(label, []).append((time.perf_counter() - started) * 1000)
+        statuses = self.statuses.setdefault(label, {})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return response
+
+    def report(self, wall_seconds):
+        return {
+            label: {
+                **summarize(samples),
+                "throughput_rps": round(len(samples) / wall_seconds, 1),
+                "errors": sum(count for code, count in self.statuses[label].items() if code >= 400),
+                "status_codes": {str(code): count for code, count in sorted(self.statuses[label].items())},
+            }
+            for label, samples in sorted(self.samples.items())
+        }
+
+
+async def login(client, user, recorder, args, rng):
+    await recorder.call(client, "POST /api/auth/login", "POST", "/api/auth/login",
+                        json={"email": user["email"], "password": PASSWORD})
+
+
+async def dashboard(client, user, recorder, args, rng):
+    # What the Dashboard page requests on load
+    headers = user["headers"]
+    await asyncio.gather(
+        recorder.call(client, "GET /api/dashboard/stats", "GET", "/api/dashboard/stats", headers=headers),
+        recorder.call(client, "GET /api/transactions?limit=5", "GET", "/api/transactions", headers=headers, params={"limit": 5}),
+        recorder.call(client, "GET /api/analytics/monthly-comparison", "GET", "/api/analytics/monthly-comparison", headers=headers),
+        recorder.call(client, "GET /api/bills", "GET", "/api/bills", headers=headers),
+        recorder.call(client, "GET /api/goals", "GET", "/api/goals", headers=headers),
+    )
+
+
+async def pagination(client, user, recorder, args, rng):
+    params = {}
+    for _ in range(args.pages):
+        response = await recorder.call(client, "GET /api/transactions (page)", "GET", "/api/transactions",
+                                       headers=user["headers"], params=params)
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+        params = {"cursor": cursor}
+
+
+async def search(client, user, recorder, args, rng):
+    await recorder.call(client, "GET /api/transactions/search", "GET", "/api/transactions/search",
+                        headers=user["headers"], params={"q": rng.choice(SEARCH_QUERIES)})
+
+
+async def analytics(client, user, recorder, args, rng):
+    headers = user["headers"]
+    await recorder.call(client, "GET /api/analytics/series?granularity=month", "GET", "/api/analytics/series",
+                        headers=headers, params={"granularity": "month", "group_by": "categoria"})
+    await recorder.call(client, "GET /api/analytics/category-breakdown", "GET", "/api/analytics/category-breakdown", headers=headers)
+    await recorder.call(client, "GET /api/analytics/upcoming-bills?days=30", "GET", "/api/analytics/upcoming-bills",
+                        headers=headers, params={"days": 30})
+
+
+async def export(client, user, recorder, args, rng):
+    export_format = rng.choice(["csv", "xlsx"])
+    await recorder.call(client, f"GET /api/export/xlsx?format={export_format}", "GET", "/api/export/xlsx",
+                        headers=user["headers"], params={"format": export_format})
+
+
+SCENARIOS = {
+    "login": login,
+    "dashboard": dashboard,
+    "pagination": pagination,
+    "search": search,
+    "analytics": analytics,
+    "export": export,
+}
+
+
+async def seed_user(client, index, args, rng):
+    email = f"bench-{index}@example.com"
+    response = await client.post("/api/auth/register", json={"name": f"Bench {index}", "email": email, "password": PASSWORD})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    remaining = args.transactions
+    while remaining > 0:
+        size = min(remaining, server.TRANSACTIONS_BATCH_MAX)
+        operations = [{"op": "create", "data": transaction_payload(rng)} for _ in range(size)]
+        response = await client.post("/api/transactions/batch", headers=headers, json={"operations": operations})
+        response.raise_for_status()
+        remaining -= size
+
+    today = datetime.now(timezone.utc).date()
+    for i in range(args.bills):
+        response = await client.post("/api/bills", headers=headers, json={
+            "tipo": rng.choice(["a_pagar", "a_receber"]),
+            "titulo": f"Conta {i}",
+            "valor": round(rng.uniform(20, 2000), 2),
+            "vencimento": (today + timedelta(days=rng.randint(-30, 60))).isoformat(),
+            "categoria": "Contas",
+        })
+        response.raise_for_status()
+    for i in range(args.goals):
+        response = await client.post("/api/goals", headers=headers, json={
+            "titulo": f"Meta {i}",
+            "valor_alvo": round(rng.uniform(1000, 50000), 2),
+            "prazo": (today + timedelta(days=rng.randint(30, 720))).isoformat(),
+        })
+        response.raise_for_status()
+    return {"email": email, "headers": headers}
+
+
+async def run_scenario(name, client, users, args):
+    recorder = Recorder()
+    worker = SCENARIOS[name]
+    deadline = time.perf_counter() + args.duration
+
+    async def loop(index):
+        # Each virtual user gets its own random stream, so runs repeat exactly
+        rng = random.Random(f"{args.seed}-{name}-{index}")
+        user = users[index % len(users)]
+        while time.perf_counter() < deadline:
+            await worker(client, user, recorder, args, rng)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop(index) for index in range(args.concurrency)))
+    wall_seconds = time.perf_counter() - started
+    return {"concurrency": args.concurrency, "wall_seconds": round(wall_seconds, 2), "endpoints": recorder.report(wall_seconds)}
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{revision}-dirty" if dirty else revision
+
+
+def compare(baseline, current, threshold):
+    # p95 and throughput per endpoint; a p95 slower by more than threshold% is a regression
+    rows, regressions = [], []
+    for scenario, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(scenario, {}).get("endpoints", {})
+        for label, stats in result["endpoints"].items():
+            if label not in before:
+                continue
+            old = before[label]
+            row = {
+                "scenario": scenario,
+                "endpoint": label,
+                "p95_ms": [old["p95_ms"], stats["p95_ms"]],
+                "p95_change_pct": round((stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100, 1) if old["p95_ms"] else None,
+                "throughput_rps": [old["throughput_rps"], stats["throughput_rps"]],
+            }
+            rows.append(row)
+            if row["p95_change_pct"] is not None and row["p95_change_pct"] > threshold:
+                regressions.append(f"{scenario}: {label}")
+    return {"baseline_revision": baseline.get("meta", {}).get("revision"), "threshold_pct": threshold,
+            "endpoints": rows, "regressions": regressions}
+
+
+async def run(args):
+    if args.mongomock:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--mongomock needs the mongomock-motor package")
+        server.client = AsyncMongoMockClient()
+        server.db = server.client[server.db.name]
+        server.analytics_db = server.db
+    else:
+        if "bench" not in server.db.name:
+            sys.exit(f"Refusing to drop {server.db.name!r}: point DB_NAME at a scratch database containing 'bench'")
+        await server.client.drop_database(server.db.name)
+        await server.ensure_indexes()
+
+    transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120, limits=limits) as client:
+        rng = random.Random(args.seed)
+        seed_started = time.perf_counter()
+        users = [await seed_user(client, index, args, rng) for index in range(args.users)]
+        seed_seconds = time.perf_counter() - seed_started
+
+        scenarios = {}
+        for name in args.scenarios:
+            scenarios[name] = await run_scenario(name, client, users, args)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "mongo": "mongomock" if args.mongomock else server.db.name,
+            "seed_seconds": round(seed_seconds, 2),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "scenarios": scenarios,
+    }
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+    if args.compare:
+        with open(args.compare) as handle:
+            report["comparison"] = compare(json.load(handle), report, args.threshold)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--transactions", type=int, default=5000, help="per user")
+    parser.add_argument("--bills", type=int, default=40, help="per user")
+    parser.add_argument("--goals", type=int, default=5, help="per user")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--pages", type=int, default=5, help="pages walked per pagination iteration")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p95 slowdown (%%) flagged as a regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    return 1 if report.get("comparison", {}).get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
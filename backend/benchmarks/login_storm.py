@@ -0,0 +1,76 @@
+"""Measure /api/transactions latency while a login storm hits the server.
+
+Runs against a live backend, first with only the transaction readers and then
+with concurrent logins on top, and prints p50/p95/p99 for both phases:
+
+    cd backend && python -m benchmarks.login_storm --base-url http://localhost:8001
+
+Start the target server with RATE_LIMIT_ENABLED=false, or the storm measures
+the limiter's 429s instead of the bcrypt pool. Responses are counted by status
+code in both phases, so any refusal shows up in the output.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.common import PASSWORD, register, summarize
+
+
+async def read_transactions(client, headers, deadline, samples, outcomes):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get("/api/transactions", headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+        outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+
+
+async def login_loop(client, email, deadline, outcomes):
+    while time.perf_counter() < deadline:
+        response = await client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+        outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+
+
+async def phase(client, headers, email, readers, logins, duration):
+    deadline = time.perf_counter() + duration
+    samples, read_outcomes, login_outcomes = [], {}, {}
+    await asyncio.gather(
+        *(read_transactions(client, headers, deadline, samples, read_outcomes) for _ in range(readers)),
+        *(login_loop(client, email, deadline, login_outcomes) for _ in range(logins)),
+    )
+    return {
+        "transactions": summarize(samples),
+        "transactions_status_codes": read_outcomes,
+        "login_status_codes": login_outcomes,
+    }
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.readers + args.logins + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30, limits=limits) as client:
+        email, headers = await register(client)
+        for i in range(20):
+            await client.post("/api/transactions", headers=headers, json={
+                "tipo": "saida", "categoria": "Bench", "subcategoria": "Bench",
+                "valor": 10 + i, "descricao": f"bench {i}", "data": "2026-01-01",
+            })
+        return {
+            "baseline": await phase(client, headers, email, args.readers, 0, args.duration),
+            "login_storm": await phase(client, headers, email, args.readers, args.logins, args.duration),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
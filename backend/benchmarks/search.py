@@ -0,0 +1,54 @@
+"""Latency of /api/transactions/search on large histories.
+
+Seeds one user per size, fills the search terms through reindex_search (the
+same path as `manage.py search reindex`) and times the search pipeline for a
+few typical queries:
+
+    cd backend && python -m benchmarks.search --sizes 10000 100000
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import seed_transactions, time_async
+
+import server
+
+QUERIES = ["su", "mercado", "alimentacao super", "uber", "freelance consult"]
+
+
+async def search(user_id, query, limit=20):
+    words = [word for word in server.search_words(query) if len(word) >= server.SEARCH_MIN_PREFIX]
+    pipeline = server.search_pipeline({"user_id": user_id}, words, 0, limit)
+    return await server.db.transactions.aggregate(pipeline).to_list(limit + 1)
+
+
+async def run(sizes, runs):
+    db = server.db
+    await server.ensure_indexes()
+    report = []
+    for size in sizes:
+        user_id = f"bench-search-{size}"
+        await db.transactions.delete_many({"user_id": user_id})
+        await seed_transactions(db, user_id, size)
+        await server.reindex_search()
+
+        queries = {}
+        for query in QUERIES:
+            timing, hits = await time_async(lambda: search(user_id, query), runs)
+            queries[query] = {**timing, "hits": len(hits)}
+        report.append({"transactions": size, "queries": queries})
+        await db.transactions.delete_many({"user_id": user_id})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.sizes, args.runs)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
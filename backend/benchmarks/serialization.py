@@ -0,0 +1,71 @@
+"""Serialization CPU time and payload size for one page of transactions.
+
+Compares the old path (response_model validation + stdlib JSON) with the
+orjson default response class and with the fast path used by the list routes:
+
+    cd backend && python -m benchmarks.serialization --rows 1000
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import time
+from typing import List
+
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.common import make_transaction, summarize
+
+import server
+
+
+async def validated(field, rows, response_class):
+    content = await serialize_response(field=field, response_content=rows, is_coroutine=True)
+    return response_class(content).body
+
+
+async def fast_path(rows):
+    return server.fast_json(Response(), rows, server.Transaction).body
+
+
+async def measure(fn, repeat):
+    samples = []
+    body = b""
+    for _ in range(repeat):
+        started = time.process_time()
+        body = await fn()
+        samples.append((time.process_time() - started) * 1000)
+    return {
+        "cpu": summarize(samples),
+        "bytes": len(body),
+        "gzip_bytes": len(gzip.compress(body, compresslevel=server.GZIP_LEVEL)),
+    }
+
+
+async def run(args):
+    rng = random.Random(42)
+    rows = [make_transaction("bench-user", rng) for _ in range(args.rows)]
+    field = create_response_field(name="Response_get_transactions", type_=List[server.Transaction])
+
+    return {
+        "rows": args.rows,
+        "pydantic_stdlib_json": await measure(lambda: validated(field, rows, JSONResponse), args.repeat),
+        "pydantic_orjson": await measure(lambda: validated(field, rows, ORJSONResponse), args.repeat),
+        "fast_path_orjson": await measure(lambda: fast_path(rows), args.repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
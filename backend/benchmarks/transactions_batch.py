@@ -0,0 +1,81 @@
+"""Compare N single POST /api/transactions calls with one batch call.
+
+Runs against a live backend and prints the wall time of both approaches:
+
+    cd backend && python -m benchmarks.transactions_batch --base-url http://localhost:8001 --count 1000
+
+Start the target server with RATE_LIMIT_ENABLED=false: a thousand calls from
+one user and IP are far past the limiter's burst. Responses are counted by
+status code, and the speedup is only reported when every call succeeded.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.common import register, transaction_payload
+
+
+def payloads(count):
+    rng = random.Random(7)
+    return [transaction_payload(rng) for _ in range(count)]
+
+
+def count_status(statuses, response):
+    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def single_calls(client, headers, items):
+    statuses = {}
+    started = time.perf_counter()
+    for item in items:
+        count_status(statuses, await client.post("/api/transactions", headers=headers, json=item))
+    return time.perf_counter() - started, statuses
+
+
+async def batch_call(client, headers, items):
+    statuses = {}
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/transactions/batch",
+        headers=headers,
+        json={"operations": [{"op": "create", "data": item} for item in items]},
+    )
+    elapsed = time.perf_counter() - started
+    count_status(statuses, response)
+    if response.is_success:
+        assert response.json()["falhas"] == 0, response.json()
+    return elapsed, statuses
+
+
+async def run(args):
+    items = payloads(args.count)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=300) as client:
+        _, headers = await register(client)
+        single, single_statuses = await single_calls(client, headers, items)
+        batch, batch_statuses = await batch_call(client, headers, items)
+    # A 429 answers in microseconds, so any refusal makes the timings meaningless
+    all_ok = set(single_statuses) | set(batch_statuses) <= {200, 201}
+    return {
+        "count": args.count,
+        "single_calls_s": round(single, 3),
+        "single_status_codes": single_statuses,
+        "batch_call_s": round(batch, 3),
+        "batch_status_codes": batch_statuses,
+        "speedup": round(single / batch, 1) if batch and all_ok else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--count", type=int, default=1000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Production launch: several uvicorn workers under gunicorn.
+
+    cd backend && gunicorn server:app
+
+Workers default to one per available CPU, counting container CPU quotas, up to
+MAX_DEFAULT_WORKERS (WEB_CONCURRENCY overrides). With more than one, the worker
+bus defaults to MongoDB so every worker sees the same cache invalidations and
+events.
+"""
+import math
+import os
+import subprocess
+import sys
+
+# Each worker has its own Mongo pool and bcrypt threads, so a big host should
+# opt into more workers explicitly rather than get one per core
+MAX_DEFAULT_WORKERS = 4
+
+
+def available_cpus() -> int:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # Affinity ignores cgroup CPU quotas, which is how containers are sized
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as handle:
+            quota, period = handle.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8001')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(available_cpus(), MAX_DEFAULT_WORKERS)))
+# Streaming exports can keep a request open for a while
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+# Rate limit buckets stay per worker unless RATE_LIMIT_BACKEND=mongo is set:
+# sharing them costs a Mongo round-trip per bucket on every /api request
+if workers > 1:
+    os.environ.setdefault("WORKER_BUS", "mongo")
+
+
+# Run once by the master before the workers fork, instead of by every worker
+STARTUP_COMMANDS = [
+    ["indexes", "ensure"],
+    # Until it has converted everything, legacy string dates are invisible to
+    # period filters and cursor pages; afterwards this is a single lookup
+    ["migrate", "storage", "--if-pending"],
+]
+# A large migration may need more; it is resumable, so a cut-off run just
+# continues on the next start or by hand
+STARTUP_COMMAND_TIMEOUT_SECONDS = int(os.environ.get("STARTUP_COMMAND_TIMEOUT_SECONDS", "300"))
+
+
+def on_starting(server):
+    # Fail fast when MongoDB is unreachable instead of holding the boot
+    env = {"MONGO_SERVER_SELECTION_TIMEOUT_MS": "5000", **os.environ}
+    for command in STARTUP_COMMANDS:
+        try:
+            result = subprocess.run(
+                [sys.executable, "manage.py", *command],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env=env,
+                stdout=subprocess.DEVNULL,
+                timeout=STARTUP_COMMAND_TIMEOUT_SECONDS,
+            )
+        except subprocess.TimeoutExpired:
+            server.log.warning("manage.py %s timed out after %ss", " ".join(command), STARTUP_COMMAND_TIMEOUT_SECONDS)
+            continue
+        if result.returncode:
+            server.log.warning("manage.py %s exited with %s", " ".join(command), result.returncode)
+    # The workers inherit this when they fork
+    os.environ["ENSURE_INDEXES_ON_STARTUP"] = "false"
@@ -0,0 +1,87 @@
+"""Maintenance commands for the FinControl backend.
+
+    python manage.py rollups verify [--user USER_ID]
+    python manage.py rollups rebuild [--user USER_ID]
+    python manage.py indexes ensure
+    python manage.py indexes report
+    python manage.py migrate storage [--if-pending]
+    python manage.py search reindex [--rebuild]
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+import server
+
+
+async def rollups(args) -> int:
+    if args.action == "verify":
+        drift = await server.verify_rollups(args.user)
+    else:
+        drift = await server.rebuild_rollups(args.user)
+
+    print(json.dumps({"action": args.action, "drift": drift}, indent=2, ensure_ascii=False))
+    # verify exits non-zero on drift so it can gate deploys and cron checks
+    return 1 if drift and args.action == "verify" else 0
+
+
+async def indexes(args) -> int:
+    if args.action == "ensure":
+        await server.ensure_indexes()
+    report = await server.index_report()
+    print(json.dumps(report, indent=2))
+    healthy = all(index["matches"] for collection in report.values() for index in collection["expected"])
+    return 0 if healthy else 1
+
+
+async def migrate(args) -> int:
+    if args.if_pending and not await server.storage_migration_pending():
+        print(json.dumps({"skipped": "storage already migrated"}))
+        return 0
+    report = await server.migrate_storage(args.batch_size)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    # Invalid documents need a manual fix before the migration is complete
+    return 1 if any(report[collection]["invalid"] for collection in server.LEGACY_FORMAT_FILTERS) else 0
+
+
+async def search(args) -> int:
+    report = await server.reindex_search(args.batch_size, rebuild=args.rebuild)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="FinControl maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rollups_parser = commands.add_parser("rollups", help="recompute user_rollups from raw transactions")
+    rollups_parser.add_argument("action", choices=["verify", "rebuild"])
+    rollups_parser.add_argument("--user", help="restrict to a single user id")
+    rollups_parser.set_defaults(handler=rollups)
+
+    indexes_parser = commands.add_parser("indexes", help="create or compare the expected MongoDB indexes")
+    indexes_parser.add_argument("action", choices=["ensure", "report"])
+    indexes_parser.set_defaults(handler=indexes)
+
+    migrate_parser = commands.add_parser("migrate", help="convert documents to the current storage format")
+    migrate_parser.add_argument("action", choices=["storage"])
+    migrate_parser.add_argument("--batch-size", type=int, default=server.MIGRATION_BATCH_SIZE)
+    migrate_parser.add_argument("--if-pending", action="store_true", help="do nothing once a run has converted everything")
+    migrate_parser.set_defaults(handler=migrate)
+
+    search_parser = commands.add_parser("search", help="fill the transaction search terms")
+    search_parser.add_argument("action", choices=["reindex"])
+    search_parser.add_argument("--rebuild", action="store_true", help="recompute every transaction, not only unindexed ones")
+    search_parser.add_argument("--batch-size", type=int, default=server.MIGRATION_BATCH_SIZE)
+    search_parser.set_defaults(handler=search)
+
+    args = parser.parse_args()
+    try:
+        return asyncio.run(args.handler(args))
+    finally:
+        server.client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
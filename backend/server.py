@@ -1,39 +1,474 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response, UploadFile, File, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne, DeleteOne, IndexModel, ReturnDocument, ReadPreference, CursorType, ASCENDING, DESCENDING
+from pymongo import monitoring
+from pymongo.errors import BulkWriteError, CollectionInvalid, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
 import os
+import asyncio
+import base64
+import json
 import logging
+import socket
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, EmailStr, ConfigDict, ValidationError, AfterValidator, model_validator
+from typing import Annotated, List, Optional
 import uuid
-from datetime import datetime, timezone, timedelta
+import hashlib
+import secrets
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone, timedelta
+from decimal import Decimal, ROUND_HALF_UP
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from openpyxl import Workbook
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse, ORJSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
 import io
+import re
+import csv
+import zipfile
+import codecs
+import unicodedata
+import calendar
+import bisect
+import threading
+import orjson
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from xml.sax.saxutils import escape as xml_escape
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics
+# In-process Prometheus registry: MetricsMiddleware times every request per
+# route template and MongoMetricsListener times every Mongo command per
+# collection. Slow find/aggregate commands are explained (rate limited) to
+# compare documents examined with documents returned. Exposed on /metrics.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '1000'))
+MONGO_EXPLAIN_SLOW_MS = int(os.environ.get('MONGO_EXPLAIN_SLOW_MS', '200'))
+MONGO_EXPLAIN_INTERVAL_SECONDS = int(os.environ.get('MONGO_EXPLAIN_INTERVAL_SECONDS', '300'))
+MONGO_EXAMINED_RATIO_WARN = int(os.environ.get('MONGO_EXAMINED_RATIO_WARN', '10'))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class MetricsRegistry:
+    def __init__(self):
+        # Mongo listeners run on Motor's worker threads
+        self._lock = threading.Lock()
+        self._families = {}
+
+    def _family(self, name: str, kind: str, help_text: str) -> dict:
+        return self._families.setdefault(name, {"type": kind, "help": help_text, "samples": {}})["samples"]
+
+    def inc(self, name: str, help_text: str, labels: tuple, value: float = 1):
+        with self._lock:
+            samples = self._family(name, "counter", help_text)
+            samples[labels] = samples.get(labels, 0) + value
+
+    def add(self, name: str, help_text: str, labels: tuple, value: float):
+        with self._lock:
+            samples = self._family(name, "gauge", help_text)
+            samples[labels] = samples.get(labels, 0) + value
+
+    def observe(self, name: str, help_text: str, labels: tuple, value: float, buckets: tuple = LATENCY_BUCKETS):
+        with self._lock:
+            samples = self._family(name, "histogram", help_text)
+            samples.setdefault(labels, Histogram(buckets)).observe(value)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, family in sorted(self._families.items()):
+                lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} {family['type']}")
+                for labels, sample in sorted(family["samples"].items()):
+                    if family["type"] != "histogram":
+                        lines.append(f"{name}{metric_labels(labels)} {sample}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(sample.buckets + ("+Inf",), sample.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{metric_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{metric_labels(labels)} {sample.sum}")
+                    lines.append(f"{name}_count{metric_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def metric_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (key + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"' for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+metrics = MetricsRegistry()
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        response = {"status": 500, "bytes": 0, "content_type": ""}
+        # The route template is only known once the router has matched
+        in_flight = (("method", scope["method"]),)
+        metrics.add("http_requests_in_flight", "Requests being served", in_flight, 1)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["content_type"] = Headers(raw=message["headers"]).get("content-type", "")
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.add("http_requests_in_flight", "Requests being served", in_flight, -1)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            labels = (("method", scope["method"]), ("route", route))
+            metrics.inc("http_requests_total", "Requests served", labels + (("status", response["status"]),))
+            metrics.observe("http_request_duration_seconds", "Request latency", labels, elapsed)
+            metrics.observe("http_response_size_bytes", "Response body size as sent", labels, response["bytes"], SIZE_BUCKETS)
+            # Event streams stay open by design
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS and not response["content_type"].startswith("text/event-stream"):
+                metrics.inc("http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS", labels)
+                logger.warning("Slow request %s %s took %.0f ms (status %s, %d bytes)",
+                               scope["method"], scope["path"], elapsed * 1000, response["status"], response["bytes"])
+
+class MongoMetricsListener(monitoring.CommandListener):
+    EXPLAINABLE = ("find", "aggregate")
+
+    def __init__(self):
+        self.loop = None  # set on startup, explains are scheduled on it
+        self._pending = {}
+        self._last_explain = {}
+        # Tailable awaitData cursors (worker bus) and change streams: their
+        # getMores block server-side until data arrives, so their duration is
+        # the wait, not latency, and stays out of the histogram
+        self._awaiting = set()
+
+    def started(self, event):
+        name = event.command_name
+        target = event.command.get("collection") if name == "getMore" else event.command.get(name)
+        command = event.command if name in self.EXPLAINABLE else None
+        waited_on = None
+        if name == "getMore":
+            waited_on = event.command.get("getMore") if event.command.get("getMore") in self._awaiting else None
+            awaits = waited_on is not None
+        elif name == "find":
+            awaits = bool(event.command.get("awaitData"))
+        elif name == "aggregate":
+            awaits = "$changeStream" in (event.command.get("pipeline") or [{}])[0]
+        else:
+            awaits = False
+        self._pending[(event.connection_id, event.request_id)] = (
+            target if isinstance(target, str) else "-", None if awaits else command, awaits, waited_on
+        )
+
+    def succeeded(self, event):
+        collection, command, awaits, waited_on = self._pending.pop((event.connection_id, event.request_id), ("-", None, False, None))
+        labels = (("collection", collection), ("command", event.command_name))
+        self._record(labels, event.duration_micros, timed=waited_on is None)
+        cursor = event.reply.get("cursor") if isinstance(event.reply, dict) else None
+        if cursor:
+            # An exhausted cursor comes back with id 0
+            if awaits and cursor.get("id"):
+                self._awaiting.add(cursor["id"])
+            elif waited_on is not None:
+                self._awaiting.discard(waited_on)
+            returned = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+            metrics.inc("mongo_documents_returned_total", "Documents returned by cursors", (("collection", collection),), returned)
+        if command is not None and MONGO_EXPLAIN_SLOW_MS and event.duration_micros >= MONGO_EXPLAIN_SLOW_MS * 1000:
+            self._schedule_explain(event.database_name, collection, command)
+
+    def failed(self, event):
+        collection, _, _, waited_on = self._pending.pop((event.connection_id, event.request_id), ("-", None, False, None))
+        labels = (("collection", collection), ("command", event.command_name))
+        self._awaiting.discard(waited_on)
+        self._record(labels, event.duration_micros, timed=waited_on is None)
+        metrics.inc("mongo_command_failures_total", "Mongo commands that failed", labels)
+
+    def _record(self, labels: tuple, duration_micros: int, timed: bool = True):
+        metrics.inc("mongo_commands_total", "Mongo commands sent", labels)
+        if timed:
+            metrics.observe("mongo_command_duration_seconds", "Mongo command latency", labels, duration_micros / 1_000_000)
+
+    def _schedule_explain(self, database: str, collection: str, command: dict):
+        key = (collection, next(iter(command)))
+        now = time.monotonic()
+        if self.loop is None or now - self._last_explain.get(key, -MONGO_EXPLAIN_INTERVAL_SECONDS) < MONGO_EXPLAIN_INTERVAL_SECONDS:
+            return
+        self._last_explain[key] = now
+        # Session and cluster fields belong to the original call, not the explain
+        plain = {field: value for field, value in command.items() if not field.startswith("$") and field not in ("lsid", "txnNumber", "autocommit", "startTransaction")}
+        self.loop.call_soon_threadsafe(self.loop.create_task, explain_command(database, collection, plain))
+
+def execution_stats(plan) -> Optional[dict]:
+    # find explains carry executionStats at the top, aggregate ones inside $cursor
+    if isinstance(plan, dict):
+        if "totalDocsExamined" in plan:
+            return plan
+        for value in plan.values():
+            found = execution_stats(value)
+            if found:
+                return found
+    elif isinstance(plan, list):
+        for value in plan:
+            found = execution_stats(value)
+            if found:
+                return found
+    return None
+
+async def explain_command(database: str, collection: str, command: dict):
+    try:
+        plan = await client[database].command({"explain": command, "verbosity": "executionStats"})
+    except PyMongoError as e:
+        logger.info("Could not explain slow %s on %s: %s", next(iter(command)), collection, e)
+        return
+    stats = execution_stats(plan)
+    if not stats:
+        return
+    examined, returned = stats["totalDocsExamined"], stats.get("nReturned", 0)
+    labels = (("collection", collection),)
+    metrics.inc("mongo_explains_total", "Slow commands explained", labels)
+    metrics.inc("mongo_explained_documents_examined_total", "Documents examined by explained commands", labels, examined)
+    metrics.inc("mongo_explained_documents_returned_total", "Documents returned by explained commands", labels, returned)
+    if examined > MONGO_EXAMINED_RATIO_WARN * max(returned, 1):
+        logger.warning("Slow %s on %s examined %d documents to return %d: %s",
+                       next(iter(command)), collection, examined, returned, command.get("filter", command.get("pipeline")))
+
+mongo_metrics_listener = MongoMetricsListener()
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    # Pool events fire on Motor's executor threads; a checkout starts and ends
+    # on the same thread, so the start time is kept thread-local
+    def __init__(self, recent: int = 1024):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.recent_waits = deque(maxlen=recent)
+        self.open = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_failures = {}
+        self.max_wait = 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.recent_waits.append(wait)
+            self.max_wait = max(self.max_wait, wait)
+        metrics.observe("mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", (), wait)
+        metrics.add("mongo_pool_connections_in_use", "Connections checked out of the pool", (), 1)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+        metrics.inc("mongo_pool_checkout_failures_total", "Pool checkouts that failed", (("reason", event.reason),))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+        metrics.add("mongo_pool_connections_in_use", "Connections checked out of the pool", (), -1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+        metrics.add("mongo_pool_connections_open", "Connections open in the pool", (), 1)
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+        metrics.add("mongo_pool_connections_open", "Connections open in the pool", (), -1)
+
+    # The remaining pool events are not tracked, but pymongo requires handlers
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self.recent_waits)
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
+                "open": self.open,
+                "in_use": self.in_use,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "checkout_wait_ms": {
+                    "recent": len(waits),
+                    "avg": round(sum(waits) / len(waits) * 1000, 3) if waits else 0,
+                    "p95": round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0,
+                    "max": round(self.max_wait * 1000, 3)
+                }
+            }
+
+mongo_pool_listener = MongoPoolListener()
+
 # MongoDB connection
+# Pool limits and timeouts are configurable so a burst waits a bounded time for
+# a connection instead of queueing forever. The rollup analytics routes read
+# through analytics_db, whose read preference can send them to secondaries.
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+MONGO_ANALYTICS_READ_PREFERENCE = os.environ.get('MONGO_ANALYTICS_READ_PREFERENCE', 'primary')
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+if MONGO_ANALYTICS_READ_PREFERENCE not in READ_PREFERENCES:
+    raise SystemExit(
+        f"MONGO_ANALYTICS_READ_PREFERENCE={MONGO_ANALYTICS_READ_PREFERENCE!r} is not valid; "
+        f"use one of: {', '.join(READ_PREFERENCES)}"
+    )
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    event_listeners=[mongo_metrics_listener, mongo_pool_listener]
+)
 db = client[os.environ['DB_NAME']]
+analytics_db = client.get_database(os.environ['DB_NAME'], read_preference=READ_PREFERENCES[MONGO_ANALYTICS_READ_PREFERENCE])
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 SECRET_KEY = os.environ.get('JWT_SECRET', 'fincontrol-secret-key-change-in-production')
 ALGORITHM = "HS256"
 security = HTTPBearer()
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+# Compression
+GZIP_MIN_SIZE = int(os.environ.get('GZIP_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
+# Storage format
+# Transactions and bills keep money as integer cents (valor_cents) and their
+# dates as BSON dates, so totals are exact and range filters run on indexed
+# dates. The API keeps speaking reais and ISO strings. Documents written before
+# the migration (float valor, string dates) go through the same read helpers.
+STORED_DATE_FIELDS = ("data", "vencimento", "next_vencimento")
+STORED_DATETIME_FIELDS = ("created_at", "updated_at", "data_pagamento")
+
+def to_cents(valor) -> int:
+    # Through str so 0.1 + 0.2 style binary noise does not leak into the cents
+    return int((Decimal(str(valor)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+def doc_cents(doc: dict) -> int:
+    if doc.get("valor_cents") is not None:
+        return doc["valor_cents"]
+    return to_cents(doc["valor"])
+
+def as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value[:10])
+
+def to_stored_date(value) -> datetime:
+    day = as_date(value)
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def to_stored_datetime(value) -> datetime:
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def to_storage(fields: dict) -> dict:
+    stored = dict(fields)
+    if stored.get("valor") is not None:
+        stored["valor_cents"] = to_cents(stored.pop("valor"))
+    for field in STORED_DATE_FIELDS:
+        if stored.get(field) is not None:
+            stored[field] = to_stored_date(stored[field])
+    for field in STORED_DATETIME_FIELDS:
+        if stored.get(field) is not None:
+            stored[field] = to_stored_datetime(stored[field])
+    return stored
+
+def api_view(doc: dict) -> dict:
+    view = dict(doc)
+    if view.get("valor_cents") is not None:
+        view["valor"] = view["valor_cents"] / 100
+    view.pop("valor_cents", None)
+    for field in STORED_DATE_FIELDS:
+        if isinstance(view.get(field), datetime):
+            view[field] = view[field].date().isoformat()
+    for field in STORED_DATETIME_FIELDS:
+        if isinstance(view.get(field), datetime):
+            # Motor hands back naive UTC datetimes
+            view[field] = to_stored_datetime(view[field]).isoformat()
+    return view
+
+def iso_date(value: str) -> str:
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError("Data inválida, use AAAA-MM-DD")
+
+IsoDate = Annotated[str, AfterValidator(iso_date)]
+
+# Response models read straight from transactions/bills documents
+class StoredDocument(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    @model_validator(mode="before")
+    @classmethod
+    def from_storage(cls, data):
+        return api_view(data) if isinstance(data, dict) else data
+
 # Models
 class UserCreate(BaseModel):
     name: str
@@ -57,7 +492,7 @@ class TransactionCreate(BaseModel):
     subcategoria: str
     valor: float
     descricao: str
-    data: str
+    data: IsoDate
     payment_method: Optional[str] = None  # 'dinheiro', 'credito', 'debito', 'pix'
     is_paid: bool = True
 
@@ -67,12 +502,12 @@ class TransactionUpdate(BaseModel):
     subcategoria: Optional[str] = None
     valor: Optional[float] = None
     descricao: Optional[str] = None
-    data: Optional[str] = None
+    data: Optional[IsoDate] = None
     payment_method: Optional[str] = None
     is_paid: Optional[bool] = None
+    version: Optional[int] = None  # last version read; 409 if it changed since
 
-class Transaction(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+class Transaction(StoredDocument):
     id: str
     user_id: str
     tipo: str
@@ -84,12 +519,13 @@ class Transaction(BaseModel):
     payment_method: Optional[str] = None
     is_paid: bool = True
     created_at: str
+    version: int = 0
 
 class BillCreate(BaseModel):
     tipo: str  # 'a_pagar' or 'a_receber'
     titulo: str
     valor: float
-    vencimento: str
+    vencimento: IsoDate
     categoria: str
     subcategoria: Optional[str] = None
     recorrencia: Optional[str] = None  # None, 'mensal', 'anual'
@@ -97,10 +533,10 @@ class BillCreate(BaseModel):
 
 class BillUpdate(BaseModel):
     status: Optional[str] = None  # 'pendente', 'pago', 'atrasado'
-    data_pagamento: Optional[str] = None
+    data_pagamento: Optional[datetime] = None
+    version: Optional[int] = None
 
-class Bill(BaseModel):
-    model_config = ConfigDict(extra="ignore")
+class Bill(StoredDocument):
     id: str
     user_id: str
     tipo: str
@@ -113,7 +549,25 @@ class Bill(BaseModel):
     recorrencia: Optional[str] = None
     observacoes: Optional[str] = None
     data_pagamento: Optional[str] = None
+    recurrence_id: Optional[str] = None
     created_at: str
+    version: int = 0
+
+class BillRecurrence(StoredDocument):
+    id: str
+    user_id: str
+    tipo: str
+    titulo: str
+    valor: float
+    vencimento: str  # first occurrence, its day anchors the following ones
+    categoria: str
+    subcategoria: Optional[str] = None
+    recorrencia: str
+    observacoes: Optional[str] = None
+    next_vencimento: str  # first occurrence not materialized yet
+    active: bool = True
+    created_at: str
+    version: int = 0
 
 class GoalCreate(BaseModel):
     titulo: str
@@ -125,6 +579,7 @@ class GoalUpdate(BaseModel):
     titulo: Optional[str] = None
     valor_alvo: Optional[float] = None
     prazo: Optional[str] = None
+    version: Optional[int] = None
 
 class Goal(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -135,6 +590,7 @@ class Goal(BaseModel):
     valor_atual: float
     prazo: str
     created_at: str
+    version: int = 0
 
 class InvestmentTip(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -154,13 +610,65 @@ class DashboardStats(BaseModel):
     transacoes_recentes: int
     metas_ativas: int
     contas_a_vencer: int
+    contas_vencendo_hoje: int = 0
+    contas_atrasadas: int = 0
+
+class TransactionBatchOperation(BaseModel):
+    op: str  # 'create', 'update' or 'delete'
+    id: Optional[str] = None
+    data: Optional[dict] = None
+
+class TransactionBatch(BaseModel):
+    operations: List[TransactionBatchOperation]
+    atomic: bool = False
+
+class ExportJobCreate(BaseModel):
+    format: str = "xlsx"  # 'xlsx' or 'csv'
+    tipo: Optional[str] = None
+    data_inicio: Optional[str] = None
+    data_fim: Optional[str] = None
+
+class ExportJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    status: str  # 'queued', 'running', 'done', 'failed'
+    format: str
+    filters: dict
+    progress: dict
+    size: Optional[int] = None
+    error: Optional[str] = None
+    cached: bool = False
+    created_at: str
+    finished_at: Optional[str] = None
+    expires_at: Optional[str] = None
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+# bcrypt is deliberately slow, so it runs on a dedicated pool instead of the
+# event loop; once PASSWORD_HASH_MAX_PENDING calls are queued, new ones are shed
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_hash_stats = {"pending": 0, "rejected": 0}
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def run_password_job(fn, *args):
+    if password_hash_stats["pending"] >= PASSWORD_HASH_MAX_PENDING:
+        password_hash_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Servidor ocupado, tente novamente em instantes",
+            headers={"Retry-After": "1"}
+        )
+    password_hash_stats["pending"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_hash_executor, fn, *args)
+    finally:
+        password_hash_stats["pending"] -= 1
+
+async def hash_password(password: str) -> str:
+    return await run_password_job(pwd_context.hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_job(pwd_context.verify, plain_password, hashed_password)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -168,21 +676,1876 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# User cache
+# Authenticated user documents keyed by the JWT "sub", so most requests skip the
+# db.users lookup. With AUTH_JWT_CLAIMS_ONLY the user is built from the token
+# claims alone; profile edits then only show up on tokens issued afterwards.
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+AUTH_JWT_CLAIMS_ONLY = os.environ.get('AUTH_JWT_CLAIMS_ONLY', 'false').lower() in ('1', 'true', 'yes')
+USER_CLAIMS = ("name", "email", "created_at")
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+def user_claims(user: dict) -> dict:
+    return {"sub": user["id"], **{claim: user[claim] for claim in USER_CLAIMS}}
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    return await user_from_token(credentials.credentials)
+
+async def user_from_token(token: str) -> dict:
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if AUTH_JWT_CLAIMS_ONLY and all(claim in payload for claim in USER_CLAIMS):
+            return {"id": user_id, **{claim: payload[claim] for claim in USER_CLAIMS}}
+        
+        user = user_cache.get(user_id)
         if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+            if user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            user_cache.set(user_id, user)
         return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_admin_user(current_user: dict = Depends(get_current_user)) -> dict:
+    if current_user["email"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
+    return current_user
+
+def parse_date_param(value: str, field: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Data inválida em {field}, use AAAA-MM-DD")
+
+def date_range_query(data_inicio: Optional[str], data_fim: Optional[str], names=("data_inicio", "data_fim")) -> dict:
+    # The exclusive upper bound also covers values carrying a time component
+    date_range = {}
+    if data_inicio:
+        date_range["$gte"] = to_stored_date(parse_date_param(data_inicio, names[0]))
+    if data_fim:
+        date_range["$lt"] = to_stored_date(parse_date_param(data_fim, names[1]) + timedelta(days=1))
+    return date_range
+
+# Worker bus
+# Each worker process keeps its own caches and SSE subscribers, so cache
+# invalidations and live events go through a bus. WORKER_BUS=memory delivers
+# inside this process only (one worker); WORKER_BUS=mongo also appends every
+# message to a capped collection that all workers tail. Messages are applied
+# locally right away and sent to the others in the background.
+WORKER_BUS = os.environ.get('WORKER_BUS', 'memory')
+WORKER_BUS_BYTES = int(os.environ.get('WORKER_BUS_BYTES', str(4 * 1024 * 1024)))
+# Identifies this process on the bus and as a lease owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class MemoryWorkerBus:
+    def __init__(self):
+        self.handlers = {}
+        self.published = 0
+        self.received = 0
+
+    def subscribe(self, channel: str, handler):
+        self.handlers[channel] = handler
+
+    def publish(self, channel: str, message: dict):
+        self.handlers[channel](message)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {"backend": WORKER_BUS, "worker_id": WORKER_ID, "published": self.published, "received": self.received}
+
+class MongoWorkerBus(MemoryWorkerBus):
+    def __init__(self):
+        super().__init__()
+        self.sending = set()
+
+    def publish(self, channel: str, message: dict):
+        super().publish(channel, message)
+        task = asyncio.create_task(self.send(channel, message))
+        # Keep a reference so the task is not garbage collected mid-send
+        self.sending.add(task)
+        task.add_done_callback(self.sending.discard)
+
+    async def send(self, channel: str, message: dict):
+        try:
+            await db.worker_bus.insert_one({"channel": channel, "message": message, "origin": WORKER_ID, "at": datetime.now(timezone.utc)})
+        except PyMongoError as e:
+            logger.error("Worker bus message on %s not sent: %s", channel, e)
+
+    async def listen(self):
+        try:
+            await db.create_collection("worker_bus", capped=True, size=WORKER_BUS_BYTES)
+        except CollectionInvalid:
+            # A send that raced the first listener created it as a plain collection
+            if not (await db.worker_bus.options()).get("capped"):
+                await db.command("convertToCapped", "worker_bus", size=WORKER_BUS_BYTES)
+        # A tailable cursor with no match dies at once, so each listener starts
+        # by announcing itself; older messages are skipped by date
+        started = datetime.now(timezone.utc)
+        await db.worker_bus.insert_one({"channel": "hello", "origin": WORKER_ID, "at": started})
+        cursor = db.worker_bus.find({"at": {"$gte": started}}, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for document in cursor:
+                handler = self.handlers.get(document["channel"])
+                if handler and document["origin"] != WORKER_ID:
+                    handler(document["message"])
+                    self.received += 1
+            await asyncio.sleep(1)
+
+WORKER_BUSES = {
+    "memory": MemoryWorkerBus,
+    "mongo": MongoWorkerBus,
+}
+worker_bus = WORKER_BUSES[WORKER_BUS]()
+# Caches whose entries are invalidated by key across workers
+shared_caches = {"users": user_cache}
+worker_bus.subscribe("cache", lambda message: shared_caches[message["cache"]].invalidate(message["key"]))
+
+def invalidate_cached(cache: str, key: str):
+    worker_bus.publish("cache", {"cache": cache, "key": key})
+
+async def watch_worker_bus():
+    # Runs under run_periodically; whatever was missed while not listening
+    # may be stale, so the shared caches start over on every (re)connect
+    for cache in shared_caches.values():
+        cache.clear()
+    await worker_bus.listen()
+
+# Job leases
+# Periodic jobs run in every worker but only do work while holding the job's
+# lease in db.job_leases, so one worker (across all hosts) runs each job. The
+# holder renews it on every run; if it dies the lease expires and another
+# worker takes over.
+async def hold_lease(name: str, seconds: float) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await db.job_leases.update_one(
+            {"_id": name, "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lease exists and is held by a live worker, so the upsert collided
+        return False
+    return True
+
+# Rate limiting
+# Token buckets per user (JWT sub) and per client IP, charged per request with
+# a route weight, plus a cap on concurrent heavy requests per user. Buckets
+# live in process memory by default, so each worker enforces the limits on its
+# own; RATE_LIMIT_BACKEND=mongo shares them through the rate_limits collection
+# at one or two round-trips per request. Over the limit the request gets 429
+# with Retry-After before reaching the route.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_USER_BURST = float(os.environ.get('RATE_LIMIT_USER_BURST', '120'))
+RATE_LIMIT_USER_PER_SECOND = float(os.environ.get('RATE_LIMIT_USER_PER_SECOND', '2'))
+RATE_LIMIT_IP_BURST = float(os.environ.get('RATE_LIMIT_IP_BURST', '300'))
+RATE_LIMIT_IP_PER_SECOND = float(os.environ.get('RATE_LIMIT_IP_PER_SECOND', '5'))
+RATE_LIMIT_HEAVY_CONCURRENCY = int(os.environ.get('RATE_LIMIT_HEAVY_CONCURRENCY', '2'))
+# Proxies in front of the app that append to X-Forwarded-For (1 on Render)
+RATE_LIMIT_TRUSTED_HOPS = int(os.environ.get('RATE_LIMIT_TRUSTED_HOPS', '0'))
+RATE_LIMIT_MEMORY_KEYS = int(os.environ.get('RATE_LIMIT_MEMORY_KEYS', '100000'))
+
+# Tokens charged per request; anything not listed costs 1
+ROUTE_COSTS = {
+    ("POST", "/api/auth/login"): 5,
+    ("POST", "/api/auth/register"): 5,
+    ("GET", "/api/export/xlsx"): 20,
+    ("POST", "/api/export/jobs"): 10,
+    ("POST", "/api/transactions/import"): 20,
+    ("POST", "/api/transactions/batch"): 10,
+    ("GET", "/api/transactions/search"): 2,
+    ("GET", "/api/analytics/monthly-comparison"): 3,
+    ("GET", "/api/analytics/category-breakdown"): 3,
+    ("GET", "/api/analytics/series"): 5,
+}
+# Routes that scan or build large responses; a user may only run a few at once
+HEAVY_ROUTES = {
+    ("GET", "/api/export/xlsx"),
+    ("POST", "/api/transactions/import"),
+    ("POST", "/api/transactions/batch"),
+    ("GET", "/api/analytics/monthly-comparison"),
+    ("GET", "/api/analytics/category-breakdown"),
+    ("GET", "/api/analytics/series"),
+}
+
+class MemoryRateLimitStore:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._buckets), "maxsize": self.maxsize}
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        # Returns 0 when the tokens were taken, else the seconds until they refill
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+class MongoRateLimitStore:
+    def stats(self) -> dict:
+        return {"backend": "mongo"}
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        # Refill and charge in one atomic pipeline update, so workers share the bucket
+        now = datetime.now(timezone.utc)
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+        tokens = {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed, rate]}]}]}
+        bucket = await db.rate_limits.find_one_and_update(
+            {"key": key},
+            [
+                {"$set": {"tokens": tokens, "updated_at": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    # A full refill later the bucket is back to its default and can go
+                    "expires_at": {"$add": [now, int(capacity / rate * 1000) + 1000]}
+                }}
+            ],
+            projection={"_id": 0, "tokens": 1, "allowed": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if bucket["allowed"] else (cost - bucket["tokens"]) / rate
+
+RATE_LIMIT_STORES = {
+    "memory": lambda: MemoryRateLimitStore(RATE_LIMIT_MEMORY_KEYS),
+    "mongo": MongoRateLimitStore,
+}
+rate_limit_store = RATE_LIMIT_STORES[RATE_LIMIT_BACKEND]()
+heavy_in_flight = {}
+
+def client_ip(scope) -> str:
+    # Entries are appended left to right, so only the last RATE_LIMIT_TRUSTED_HOPS
+    # were written by our proxies; anything left of them is what the client sent
+    if RATE_LIMIT_TRUSTED_HOPS:
+        forwarded = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded:
+            hops = [hop.strip() for hop in forwarded.split(",")]
+            return hops[-min(RATE_LIMIT_TRUSTED_HOPS, len(hops))]
+    return scope["client"][0] if scope.get("client") else "-"
+
+def token_subject(scope) -> Optional[str]:
+    # Signature check only; the route itself still authenticates the user
+    authorization = Headers(scope=scope).get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        return jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+def too_many_requests(wait: float, detail: str) -> ORJSONResponse:
+    return ORJSONResponse({"detail": detail}, status_code=429, headers={"Retry-After": str(int(wait) + 1)})
+
+def count_rate_limited(bucket: str, route: tuple):
+    # Paths with ids would explode the label set; only weighted routes get their own
+    path = route[1] if route in ROUTE_COSTS else "other"
+    metrics.inc("http_rate_limited_total", "Requests refused by the rate limiter", (("bucket", bucket), ("route", path)))
+
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        route = (scope["method"], scope["path"])
+        cost = ROUTE_COSTS.get(route, 1)
+        user_id = token_subject(scope)
+        buckets = [(f"ip:{client_ip(scope)}", RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_PER_SECOND)]
+        if user_id:
+            buckets.append((f"user:{user_id}", RATE_LIMIT_USER_BURST, RATE_LIMIT_USER_PER_SECOND))
+        for key, capacity, rate in buckets:
+            try:
+                wait = await rate_limit_store.take(key, min(cost, capacity), capacity, rate)
+            except PyMongoError as e:
+                # A shared store outage must not take the API down with it
+                logger.error("Rate limit store unavailable: %s", e)
+                wait = 0.0
+            if wait:
+                count_rate_limited(key.split(":")[0], route)
+                await too_many_requests(wait, f"Muitas requisições, tente novamente em {int(wait) + 1} s")(scope, receive, send)
+                return
+
+        if route not in HEAVY_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        owner = user_id or buckets[0][0]
+        if heavy_in_flight.get(owner, 0) >= RATE_LIMIT_HEAVY_CONCURRENCY:
+            count_rate_limited("concurrency", route)
+            await too_many_requests(1, "Aguarde as requisições pesadas em andamento terminarem")(scope, receive, send)
+            return
+        heavy_in_flight[owner] = heavy_in_flight.get(owner, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            heavy_in_flight[owner] -= 1
+            if not heavy_in_flight[owner]:
+                del heavy_in_flight[owner]
+
+# Series helpers
+# /analytics/series buckets transactions with $dateTrunc and sums them per
+# bucket (and optionally per group) inside Mongo, over the (user_id, data) index.
+SERIES_GRANULARITIES = ("day", "week", "month", "year")
+SERIES_GROUP_FIELDS = ("categoria", "subcategoria", "payment_method", "tipo")
+
+# Aggregation counterparts of doc_cents/as_date, for documents not migrated yet
+CENTS_EXPR = {"$ifNull": ["$valor_cents", {"$round": [{"$multiply": ["$valor", 100]}, 0]}]}
+DATE_EXPR = {"$convert": {"input": "$data", "to": "date", "onError": None, "onNull": None}}
+
+def series_pipeline(match: dict, granularity: str, group_by: Optional[str]) -> List[dict]:
+    group_id = {
+        "period": {"$dateTrunc": {"date": DATE_EXPR, "unit": granularity, "startOfWeek": "monday"}}
+    }
+    if group_by:
+        group_id["key"] = f"${group_by}"
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": group_id,
+            "entradas": {"$sum": {"$cond": [{"$eq": ["$tipo", "entrada"]}, CENTS_EXPR, 0]}},
+            "saidas": {"$sum": {"$cond": [{"$eq": ["$tipo", "saida"]}, CENTS_EXPR, 0]}},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id.period": 1}}
+    ]
+
+def build_series(buckets: List[dict]) -> List[dict]:
+    series = {}
+    for bucket in buckets:
+        period = bucket["_id"].get("period")
+        if period is None:
+            continue
+        entradas = int(bucket["entradas"])
+        saidas = int(bucket["saidas"])
+        current = series.setdefault(bucket["_id"].get("key"), {"key": bucket["_id"].get("key"), "total": 0, "points": []})
+        current["total"] += entradas + saidas
+        current["points"].append({
+            "period": period.date().isoformat(),
+            "entradas": entradas / 100,
+            "saidas": saidas / 100,
+            "saldo": (entradas - saidas) / 100,
+            "count": bucket["count"]
+        })
+    # Biggest groups first, which is the order charts want for legends
+    ordered = sorted(series.values(), key=lambda item: item["total"], reverse=True)
+    for item in ordered:
+        item["total"] = item["total"] / 100
+    return ordered
+
+# Pagination helpers
+# Transactions are paged by (created_at, id) descending; the cursor is the
+# opaque position of the last row of the previous page.
+TRANSACTIONS_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_PAGE_SIZE', '100'))
+TRANSACTIONS_MAX_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_MAX_PAGE_SIZE', '500'))
+
+def encode_cursor(transaction: dict) -> str:
+    raw = json.dumps([api_view(transaction)["created_at"], transaction["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return to_stored_datetime(created_at), transaction_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+# Search helpers
+# Transactions carry search_terms (the accent-folded words of descricao,
+# categoria and subcategoria) and search_prefixes (every prefix of those words
+# from SEARCH_MIN_PREFIX letters on). A query matches when each of its words
+# starts some word of the transaction, which is an equality lookup on the
+# (user_id, search_prefixes, created_at) index; whole-word hits rank first.
+SEARCH_FIELDS = ("descricao", "categoria", "subcategoria")
+SEARCH_MIN_PREFIX = 2
+SEARCH_MAX_PREFIX = 20
+SEARCH_MAX_CANDIDATES = int(os.environ.get('SEARCH_MAX_CANDIDATES', '2000'))
+SEARCH_STOPWORDS = {"a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "na", "no", "nas", "nos",
+                    "para", "por", "com", "um", "uma"}
+
+def search_words(text: Optional[str]) -> List[str]:
+    words = re.findall(r"[a-z0-9]+", strip_accents(text or "").lower())
+    return [word for word in dict.fromkeys(words) if word not in SEARCH_STOPWORDS]
+
+def search_fields(doc: dict) -> dict:
+    terms = list(dict.fromkeys(word for field in SEARCH_FIELDS for word in search_words(doc.get(field))))
+    prefixes = {
+        term[:length]
+        for term in terms
+        for length in range(SEARCH_MIN_PREFIX, min(len(term), SEARCH_MAX_PREFIX) + 1)
+    }
+    return {"search_terms": terms, "search_prefixes": sorted(prefixes)}
+
+def search_pipeline(match: dict, words: List[str], offset: int, limit: int) -> List[dict]:
+    # Longest prefix first: the planner bounds the index scan on the first $all entry
+    prefixes = sorted({word[:SEARCH_MAX_PREFIX] for word in words}, key=len, reverse=True)
+    return [
+        {"$match": {**match, "search_prefixes": {"$all": prefixes}}},
+        # Only the most recent matches are ranked, which bounds the in-memory sort
+        {"$sort": {"created_at": -1, "id": -1}},
+        {"$limit": SEARCH_MAX_CANDIDATES},
+        {"$addFields": {"search_score": {"$size": {"$setIntersection": ["$search_terms", words]}}}},
+        {"$sort": {"search_score": -1, "created_at": -1, "id": -1}},
+        {"$skip": offset},
+        {"$limit": limit + 1},
+        {"$project": model_projection(Transaction)}
+    ]
+
+# Bill status helpers
+# A pending bill past its vencimento is overdue ("atrasado"). The transition is
+# persisted in bulk by the sweep job; reads derive it on the fly so they never
+# write and never lag behind the sweep interval.
+BILLS_SWEEP_INTERVAL_SECONDS = int(os.environ.get('BILLS_SWEEP_INTERVAL_SECONDS', '300'))
+bill_sweep_stats = {"runs": 0, "last_flipped": 0, "total_flipped": 0, "last_run_at": None}
+
+def bill_status_query(status: str, today: date) -> dict:
+    if status == "pendente":
+        return {"status": "pendente", "vencimento": {"$gte": to_stored_date(today)}}
+    if status == "atrasado":
+        return {"$or": [
+            {"status": "atrasado"},
+            {"status": "pendente", "vencimento": {"$lt": to_stored_date(today)}}
+        ]}
+    return {"status": status}
+
+async def sweep_overdue_bills() -> int:
+    # No change counter bump: readers already show these bills as overdue, and
+    # the bills ETags include today's date
+    today = datetime.now(timezone.utc).date()
+    result = await db.bills.update_many(
+        {"status": "pendente", "vencimento": {"$lt": to_stored_date(today)}},
+        {"$set": {"status": "atrasado"}}
+    )
+    bill_sweep_stats["runs"] += 1
+    bill_sweep_stats["last_flipped"] = result.modified_count
+    bill_sweep_stats["total_flipped"] += result.modified_count
+    bill_sweep_stats["last_run_at"] = datetime.now(timezone.utc).isoformat()
+    logger.info("Overdue bill sweep flipped %d bills", result.modified_count)
+    return result.modified_count
+
+async def run_periodically(job, interval: int, leased: bool = False):
+    while True:
+        try:
+            # The lease outlasts the sleep, so the holder keeps it between runs
+            if not leased or await hold_lease(job.__name__, interval * 2):
+                await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Any error ends only this run: with a single worker there is no
+            # other lease holder to pick the job up
+            logger.exception("Background job %s failed", job.__name__)
+        await asyncio.sleep(interval)
+
+def new_transaction_doc(user_id: str, transaction: TransactionCreate) -> dict:
+    fields = transaction.model_dump()
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        **to_storage(fields),
+        **search_fields(fields),
+        "created_at": datetime.now(timezone.utc),
+        "version": 0
+    }
+
+# Recurrence helpers
+# A recurring bill is stored once as a rule in bill_recurrences. Concrete bills
+# are materialized only up to RECURRENCE_HORIZON_DAYS ahead, by the background
+# job and on demand when an instance is paid, so the next one always exists.
+# Occurrences already past are never backfilled: a rule dated years ago gets
+# its anchor bill and then starts at the first occurrence due from today.
+# Upserts keyed by (recurrence_id, vencimento) make every run idempotent.
+RECURRENCE_MONTHS = {"mensal": 1, "anual": 12}
+RECURRENCE_HORIZON_DAYS = int(os.environ.get('RECURRENCE_HORIZON_DAYS', '60'))
+RECURRENCE_INTERVAL_SECONDS = int(os.environ.get('RECURRENCE_INTERVAL_SECONDS', '3600'))
+recurrence_stats = {"runs": 0, "last_materialized": 0, "total_materialized": 0, "last_run_at": None}
+
+def recurrence_horizon(today: date) -> date:
+    return today + timedelta(days=RECURRENCE_HORIZON_DAYS)
+
+def occurrence_date(recurrence: dict, occurrence: int) -> date:
+    # Months are counted from the anchor, so a bill due on the 31st falls on the
+    # last day of shorter months and goes back to the 31st afterwards
+    anchor = as_date(recurrence["vencimento"])
+    year, month = divmod(anchor.month - 1 + occurrence * RECURRENCE_MONTHS[recurrence["recorrencia"]], 12)
+    year, month = anchor.year + year, month + 1
+    return date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+
+def first_occurrence_from(recurrence: dict, day: date) -> int:
+    anchor = as_date(recurrence["vencimento"])
+    # Whole periods between the anchor month and day's month; that occurrence
+    # falls in day's month or earlier, the one before it in an earlier month
+    months = (day.year - anchor.year) * 12 + day.month - anchor.month
+    occurrence = max(0, months // RECURRENCE_MONTHS[recurrence["recorrencia"]])
+    while occurrence_date(recurrence, occurrence) < day:
+        occurrence += 1
+    return occurrence
+
+def recurrence_instance(recurrence: dict, occurrence: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": recurrence["user_id"],
+        "tipo": recurrence["tipo"],
+        "titulo": recurrence["titulo"],
+        "valor_cents": recurrence["valor_cents"],
+        "vencimento": to_stored_date(occurrence_date(recurrence, occurrence)),
+        "categoria": recurrence["categoria"],
+        "subcategoria": recurrence.get("subcategoria"),
+        "recorrencia": recurrence["recorrencia"],
+        "observacoes": recurrence.get("observacoes"),
+        "status": "pendente",
+        "data_pagamento": None,
+        "recurrence_id": recurrence["id"],
+        "occurrence": occurrence,
+        "created_at": datetime.now(timezone.utc),
+        "version": 0
+    }
+
+async def materialize_recurrence(recurrence: dict, today: date, through: int = -1) -> int:
+    # Every occurrence from today up to the horizon, and at least up to
+    # occurrence `through`; a new rule (nothing materialized yet) keeps its anchor
+    first = recurrence["next_occurrence"]
+    occurrence = max(first, first_occurrence_from(recurrence, today))
+    occurrences = [0] if first == 0 and occurrence > 0 else []
+    until = recurrence_horizon(today)
+    while occurrence <= through or occurrence_date(recurrence, occurrence) <= until:
+        occurrences.append(occurrence)
+        occurrence += 1
+    if not occurrences:
+        return 0
+
+    operations = []
+    for number in occurrences:
+        instance = recurrence_instance(recurrence, number)
+        operations.append(UpdateOne(
+            {"recurrence_id": recurrence["id"], "vencimento": instance["vencimento"]},
+            {"$setOnInsert": instance},
+            upsert=True
+        ))
+
+    try:
+        result = await db.bills.bulk_write(operations, ordered=False)
+        created = result.upserted_count
+    except BulkWriteError as e:
+        # A concurrent run upserted the same occurrence first
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        created = e.details["nUpserted"]
+
+    # Guarded on the value read so a slower concurrent run never moves it back
+    await db.bill_recurrences.update_one(
+        {"id": recurrence["id"], "next_occurrence": first},
+        {"$set": {
+            "next_occurrence": occurrence,
+            "next_vencimento": to_stored_date(occurrence_date(recurrence, occurrence))
+        }}
+    )
+    recurrence["next_occurrence"] = occurrence
+    if created:
+        await bump_change_counter(recurrence["user_id"], "bills")
+    return created
+
+async def materialize_recurrences() -> int:
+    today = datetime.now(timezone.utc).date()
+    until = recurrence_horizon(today)
+    created = 0
+    async for recurrence in db.bill_recurrences.find(
+        {"active": True, "next_vencimento": {"$lte": to_stored_date(until)}}, {"_id": 0}
+    ):
+        created += await materialize_recurrence(recurrence, today)
+    recurrence_stats["runs"] += 1
+    recurrence_stats["last_materialized"] = created
+    recurrence_stats["total_materialized"] += created
+    recurrence_stats["last_run_at"] = datetime.now(timezone.utc).isoformat()
+    logger.info("Recurrence job materialized %d bills", created)
+    return created
+
+async def roll_recurrence_forward(bill: dict):
+    # Paying an instance makes sure the following one exists, even past the horizon
+    recurrence = await db.bill_recurrences.find_one({"id": bill["recurrence_id"], "active": True}, {"_id": 0})
+    if recurrence and bill.get("occurrence") is not None:
+        today = datetime.now(timezone.utc).date()
+        await materialize_recurrence(recurrence, today, through=bill["occurrence"] + 1)
+
+# Change counters
+# change_counters holds one document per user with a counter per collection,
+# bumped by every write route, so readers can tell cheaply whether anything
+# changed since they last looked.
+async def bump_change_counter(user_id: str, *collections: str, session=None):
+    await db.change_counters.update_one(
+        {"user_id": user_id},
+        {"$inc": {collection: 1 for collection in collections}},
+        upsert=True,
+        session=session
+    )
+    # Inside a transaction the caller publishes once it has committed
+    if session is None:
+        publish_change(user_id, *collections)
+
+async def get_change_counters(user_id: str) -> dict:
+    counters = await db.change_counters.find_one({"user_id": user_id}, {"_id": 0, "user_id": 0})
+    return counters or {}
+
+# Live events
+# Open dashboards keep an SSE stream instead of polling. Write routes publish
+# the collections they touched over the worker bus to each process's broker,
+# and each stream answers with the stats fields that changed. With
+# EVENTS_CHANGE_STREAMS=true (needs a replica set) every process follows
+# change_counters through a change stream instead.
+EVENTS_KEEPALIVE_SECONDS = int(os.environ.get('EVENTS_KEEPALIVE_SECONDS', '15'))
+EVENTS_MAX_STREAMS_PER_USER = int(os.environ.get('EVENTS_MAX_STREAMS_PER_USER', '5'))
+EVENTS_CHANGE_STREAMS = os.environ.get('EVENTS_CHANGE_STREAMS', 'false').lower() == 'true'
+# EventSource cannot send headers, so streams open with a ticket in the query
+# string instead of the JWT: short-lived, single-use and stored only hashed,
+# so one copied from an access log is worthless
+EVENTS_TICKET_TTL_SECONDS = int(os.environ.get('EVENTS_TICKET_TTL_SECONDS', '30'))
+
+class EventBroker:
+    def __init__(self, max_streams_per_user: int):
+        self.max_streams_per_user = max_streams_per_user
+        self.subscribers = {}
+        self.published = 0
+
+    def subscribe(self, user_id: str) -> Optional[asyncio.Queue]:
+        queues = self.subscribers.setdefault(user_id, set())
+        if len(queues) >= self.max_streams_per_user:
+            return None
+        queue = asyncio.Queue(maxsize=16)
+        queues.add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(user_id, None)
+
+    def publish(self, user_id: str, collections):
+        for queue in self.subscribers.get(user_id, ()):
+            # A stream that is behind re-reads the stats anyway, so a full
+            # queue can drop notifications without losing anything
+            if not queue.full():
+                queue.put_nowait(set(collections))
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.subscribers),
+            "streams": sum(len(queues) for queues in self.subscribers.values()),
+            "published": self.published,
+            "change_streams": EVENTS_CHANGE_STREAMS
+        }
+
+event_broker = EventBroker(EVENTS_MAX_STREAMS_PER_USER)
+
+worker_bus.subscribe("events", lambda message: event_broker.publish(message["user_id"], message["collections"]))
+
+def publish_change(user_id: str, *collections: str):
+    if not EVENTS_CHANGE_STREAMS:
+        worker_bus.publish("events", {"user_id": user_id, "collections": list(collections)})
+
+async def watch_change_counters():
+    # Runs under run_periodically, which restarts it after a stream error
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update"]}}}]
+    async with db.change_counters.watch(pipeline, full_document="updateLookup") as stream:
+        async for change in stream:
+            document = change.get("fullDocument") or {}
+            if "updateDescription" in change:
+                collections = change["updateDescription"]["updatedFields"].keys()
+            else:
+                collections = [key for key in document if key not in ("_id", "user_id")]
+            if document.get("user_id"):
+                event_broker.publish(document["user_id"], collections)
+
+def ticket_hash(ticket: str) -> str:
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+async def issue_stream_ticket(user_id: str) -> str:
+    ticket = secrets.token_urlsafe(32)
+    await db.stream_tickets.insert_one({
+        "ticket_hash": ticket_hash(ticket),
+        "user_id": user_id,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=EVENTS_TICKET_TTL_SECONDS)
+    })
+    return ticket
+
+async def redeem_stream_ticket(ticket: str) -> Optional[str]:
+    # Deleted on first use; the TTL index only sweeps the unused ones
+    redeemed = await db.stream_tickets.find_one_and_delete({
+        "ticket_hash": ticket_hash(ticket),
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
+    })
+    return redeemed["user_id"] if redeemed else None
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(payload).decode()}\n\n"
+
+# Conditional GETs
+# Read routes derive a weak ETag from the user's change counters (plus anything
+# else their output depends on) and answer a matching If-None-Match with 304
+# before the collection is queried.
+def weak_etag(*parts) -> str:
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: proxies may strip or add the W/ prefix
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+async def not_modified(request: Request, response: Response, user_id: str, collections: tuple, *extra) -> Optional[Response]:
+    counters = await get_change_counters(user_id)
+    # Kept for the route, which may key its own caches on them
+    request.state.change_counters = counters
+    etag = weak_etag(user_id, {collection: counters.get(collection, 0) for collection in collections}, sorted(request.query_params.multi_items()), *extra)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Fast JSON path
+# List routes read documents projected onto their response model and hand them
+# straight to orjson, skipping a per-row Pydantic pass over data that was
+# already validated on the way in. Defaults fill fields older documents lack.
+def model_projection(model) -> dict:
+    projection = {"_id": 0, **{field: 1 for field in model.model_fields}}
+    if "valor" in projection:
+        projection["valor_cents"] = 1
+    return projection
+
+def fast_json(response: Response, rows: List[dict], model) -> ORJSONResponse:
+    defaults = {name: field.default for name, field in model.model_fields.items() if not field.is_required()}
+    if issubclass(model, StoredDocument):
+        rows = [api_view(row) for row in rows]
+    # Returning a response directly drops the injected one, so carry its headers
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    return ORJSONResponse([{**defaults, **row} for row in rows], headers=headers)
+
+# Optimistic concurrency
+# Editable documents carry a "version" bumped by every update. Clients may send
+# back the version they last read; if someone else wrote in between, the update
+# filter no longer matches and the route answers 409 instead of overwriting.
+def version_filter(version: Optional[int]) -> dict:
+    if version is None:
+        return {}
+    # Documents written before versioning have no field and count as 0
+    if version == 0:
+        return {"$or": [{"version": 0}, {"version": {"$exists": False}}]}
+    return {"version": version}
+
+def versioned_update(changes: dict, now: Optional[datetime] = None) -> dict:
+    return {
+        "$set": {"updated_at": now or datetime.now(timezone.utc), **changes},
+        "$inc": {"version": 1}
+    }
+
+async def update_owned(collection, doc_id: str, user_id: str, changes: dict, version: Optional[int],
+                       not_found: str, return_document=ReturnDocument.AFTER) -> dict:
+    # Ownership check, version check and write in a single round-trip
+    query = {"id": doc_id, "user_id": user_id, **version_filter(version)}
+    if changes:
+        doc = await collection.find_one_and_update(
+            query,
+            versioned_update(changes),
+            projection={"_id": 0},
+            return_document=return_document
+        )
+    else:
+        doc = await collection.find_one(query, {"_id": 0})
+    if doc is None:
+        # Only paid on the failure path: tell a stale version from a missing doc
+        if version is not None and await collection.count_documents({"id": doc_id, "user_id": user_id}, limit=1):
+            raise HTTPException(status_code=409, detail="Registro alterado por outra requisição, recarregue e tente novamente")
+        raise HTTPException(status_code=404, detail=not_found)
+    return doc
+
+# Rollup helpers
+# user_rollups holds one document per user and month ("YYYY-MM") with the
+# entradas/saidas totals and per tipo/categoria/subcategoria sums, all in
+# integer cents, kept in sync by the transaction write routes through $inc deltas.
+
+def _rollup_key(name: str) -> str:
+    # Mongo field names cannot contain "." nor start with "$"
+    return name.replace(".", "\uff0e").replace("$", "\uff04")
+
+def _rollup_name(key: str) -> str:
+    return key.replace("\uff0e", ".").replace("\uff04", "$")
+
+def _rollup_month(transaction: dict) -> str:
+    return as_date(transaction["data"]).isoformat()[:7]
+
+def rollup_signature(transaction: dict) -> tuple:
+    # What the rollups depend on, independent of the storage format
+    return (
+        transaction["tipo"],
+        transaction["categoria"],
+        transaction.get("subcategoria"),
+        doc_cents(transaction),
+        _rollup_month(transaction)
+    )
+
+def _rollup_inc(transaction: dict, sign: int = 1, count: Optional[int] = None) -> dict:
+    cents = sign * doc_cents(transaction)
+    count = sign if count is None else count
+    prefix = f"categorias.{_rollup_key(transaction['tipo'])}.{_rollup_key(transaction['categoria'])}"
+    inc = {
+        "count": count,
+        f"{prefix}.total_cents": cents,
+        f"{prefix}.count": count,
+    }
+    if transaction.get("subcategoria"):
+        inc[f"{prefix}.subcategorias_cents.{_rollup_key(transaction['subcategoria'])}"] = cents
+    if transaction["tipo"] == "entrada":
+        inc["entradas_cents"] = cents
+    elif transaction["tipo"] == "saida":
+        inc["saidas_cents"] = cents
+    return inc
+
+async def apply_rollup_deltas(user_id: str, added: Optional[List[dict]] = None, removed: Optional[List[dict]] = None, session=None):
+    per_month = {}
+    for transaction, sign in [(t, 1) for t in added or []] + [(t, -1) for t in removed or []]:
+        month_inc = per_month.setdefault(_rollup_month(transaction), {})
+        for field, value in _rollup_inc(transaction, sign).items():
+            month_inc[field] = month_inc.get(field, 0) + value
+
+    operations = [
+        UpdateOne({"user_id": user_id, "month": month}, {"$inc": inc}, upsert=True)
+        for month, inc in per_month.items()
+    ]
+    if operations:
+        await db.user_rollups.bulk_write(operations, ordered=False, session=session)
+
+async def compute_rollups(user_id: Optional[str] = None) -> dict:
+    match = {"user_id": user_id} if user_id else {}
+    groups = db.transactions.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "month": {"$dateToString": {"format": "%Y-%m", "date": DATE_EXPR}},
+                "tipo": "$tipo",
+                "categoria": "$categoria",
+                "subcategoria": "$subcategoria"
+            },
+            "valor_cents": {"$sum": CENTS_EXPR},
+            "count": {"$sum": 1}
+        }}
+    ], allowDiskUse=True)
+
+    rollups = {}
+    async for group in groups:
+        key = group["_id"]
+        rollup = rollups.setdefault((key["user_id"], key["month"]), {})
+        sample = {**key, "valor_cents": int(group["valor_cents"])}
+        for field, value in _rollup_inc(sample, count=group["count"]).items():
+            rollup[field] = rollup.get(field, 0) + value
+    return rollups
+
+def _flatten_rollup(doc: dict, prefix: str = "") -> dict:
+    flat = {}
+    for field, value in doc.items():
+        if field in ("_id", "user_id", "month") and not prefix:
+            continue
+        path = f"{prefix}{field}"
+        if isinstance(value, dict):
+            flat.update(_flatten_rollup(value, f"{path}."))
+        else:
+            flat[path] = value
+    return flat
+
+async def verify_rollups(user_id: Optional[str] = None) -> List[dict]:
+    expected = await compute_rollups(user_id)
+    stored = {}
+    async for doc in db.user_rollups.find({"user_id": user_id} if user_id else {}):
+        stored[(doc["user_id"], doc["month"])] = _flatten_rollup(doc)
+
+    drift = []
+    for user_month in sorted(set(expected) | set(stored)):
+        expected_fields = expected.get(user_month, {})
+        stored_fields = stored.get(user_month, {})
+        for field in sorted(set(expected_fields) | set(stored_fields)):
+            want = expected_fields.get(field, 0)
+            have = stored_fields.get(field, 0)
+            if want != have:
+                drift.append({
+                    "user_id": user_month[0],
+                    "month": user_month[1],
+                    "field": field,
+                    "stored": have,
+                    "expected": want
+                })
+    return drift
+
+async def rebuild_rollups(user_id: Optional[str] = None) -> List[dict]:
+    drift = await verify_rollups(user_id)
+    expected = await compute_rollups(user_id)
+    if user_id:
+        rewritten = {user_id}
+    else:
+        rewritten = {uid for uid, _ in expected} | set(await db.user_rollups.distinct("user_id"))
+    await db.user_rollups.delete_many({"user_id": user_id} if user_id else {})
+
+    operations = [
+        UpdateOne({"user_id": uid, "month": month}, {"$inc": fields}, upsert=True)
+        for (uid, month), fields in expected.items()
+    ]
+    for start in range(0, len(operations), 1000):
+        await db.user_rollups.bulk_write(operations[start:start + 1000], ordered=False)
+    # The dashboard and analytics ETags come from this counter; without a bump
+    # clients holding one would keep the drifted totals until the next write
+    for uid in rewritten:
+        await bump_change_counter(uid, "transactions")
+    return drift
+
+# Storage migration
+# Converts documents written before the cents/BSON date format, in _id order
+# and in batches, then rebuilds the rollups from the converted data. Safe to
+# re-run: migrated documents no longer match the legacy filters. A clean run
+# leaves a marker in db.migrations, so the deploy hook in gunicorn.conf.py
+# only pays for the legacy scans until the data is converted.
+MIGRATION_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', '1000'))
+LEGACY_FORMAT_FILTERS = {
+    "transactions": {"$or": [
+        {"valor": {"$exists": True}},
+        {"data": {"$type": "string"}},
+        {"created_at": {"$type": "string"}},
+        {"updated_at": {"$type": "string"}},
+    ]},
+    "bills": {"$or": [
+        {"valor": {"$exists": True}},
+        {"vencimento": {"$type": "string"}},
+        {"created_at": {"$type": "string"}},
+        {"updated_at": {"$type": "string"}},
+        {"data_pagamento": {"$type": "string"}},
+    ]},
+}
+
+def storage_update(doc: dict) -> dict:
+    fields = {field: doc[field] for field in STORED_DATE_FIELDS + STORED_DATETIME_FIELDS if isinstance(doc.get(field), str)}
+    if "valor" in doc and doc.get("valor_cents") is None:
+        fields["valor"] = doc["valor"]
+    update = {}
+    if fields:
+        update["$set"] = to_storage(fields)
+    if "valor" in doc:
+        update["$unset"] = {"valor": ""}
+    return update
+
+async def migrate_storage(batch_size: int = MIGRATION_BATCH_SIZE) -> dict:
+    report = {}
+    for collection, legacy in LEGACY_FORMAT_FILTERS.items():
+        counts = {"migrated": 0, "skipped": 0, "invalid": []}
+        last_id = None
+        while True:
+            query = legacy if last_id is None else {"$and": [legacy, {"_id": {"$gt": last_id}}]}
+            docs = await db[collection].find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            last_id = docs[-1]["_id"]
+            operations = []
+            for doc in docs:
+                try:
+                    update = storage_update(doc)
+                except (ValueError, TypeError, KeyError):
+                    counts["invalid"].append(doc.get("id"))
+                    continue
+                # A route write since the read bumped the version; leave that
+                # document for the next run instead of clobbering it
+                operations.append(UpdateOne({"_id": doc["_id"], **version_filter(doc.get("version", 0))}, update))
+            if operations:
+                result = await db[collection].bulk_write(operations, ordered=False)
+                counts["migrated"] += result.modified_count
+                counts["skipped"] += len(operations) - result.matched_count
+        report[collection] = counts
+    # Rollups only change when documents did
+    migrated = sum(report[collection]["migrated"] for collection in LEGACY_FORMAT_FILTERS)
+    report["rollups_drift"] = len(await rebuild_rollups()) if migrated else 0
+    # New writes use the current format, so once clean it stays clean
+    if not any(report[collection]["invalid"] or report[collection]["skipped"] for collection in LEGACY_FORMAT_FILTERS):
+        await db.migrations.update_one({"_id": "storage"}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True)
+    return report
+
+async def storage_migration_pending() -> bool:
+    return await db.migrations.find_one({"_id": "storage"}) is None
+
+# Fills search_terms/search_prefixes on transactions written before search
+# existed (or all of them with rebuild, after changing the tokenizer).
+async def reindex_search(batch_size: int = MIGRATION_BATCH_SIZE, rebuild: bool = False) -> dict:
+    query = {} if rebuild else {"search_prefixes": {"$exists": False}}
+    counts = {"indexed": 0, "skipped": 0}
+    last_id = None
+    while True:
+        page = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+        docs = await db.transactions.find(page, {field: 1 for field in SEARCH_FIELDS}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        # Guarded on the text that was read, so a concurrent edit keeps its own terms
+        result = await db.transactions.bulk_write([
+            UpdateOne({"_id": doc["_id"], **{field: doc.get(field) for field in SEARCH_FIELDS}}, {"$set": search_fields(doc)})
+            for doc in docs
+        ], ordered=False)
+        counts["indexed"] += result.matched_count
+        counts["skipped"] += len(docs) - result.matched_count
+    return counts
+
+# Export helpers
+# Exports are streamed straight from the Motor cursor: CSV rows are written as
+# they arrive and XLSX is assembled by a streaming zip writer, so memory stays
+# flat whatever the history size.
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '500'))
+EXPORT_HEADERS = ["Data", "Tipo", "Categoria", "Subcategoria", "Descrição", "Valor"]
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8"
+}
+XML_ILLEGAL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Transações" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+XLSX_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_FOOTER = '</sheetData></worksheet>'
+
+class ChunkSink(io.RawIOBase):
+    # Unseekable sink: zipfile falls back to data descriptors and the bytes
+    # written so far can be drained after every batch of rows
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def export_row(transaction: dict) -> list:
+    transaction = api_view(transaction)
+    return [
+        transaction["data"],
+        transaction["tipo"].upper(),
+        transaction["categoria"],
+        transaction.get("subcategoria") or "",
+        transaction["descricao"],
+        transaction["valor"]
+    ]
+
+def xlsx_row(values: list) -> str:
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            text = xml_escape(XML_ILLEGAL_CHARS.sub("", str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+def export_query(user_id: str, tipo: Optional[str], data_inicio: Optional[str], data_fim: Optional[str]) -> dict:
+    query = {"user_id": user_id}
+    if tipo:
+        query["tipo"] = tipo
+    date_range = date_range_query(data_inicio, data_fim)
+    if date_range:
+        query["data"] = date_range
+    return query
+
+async def export_batches(query: dict, progress: Optional[dict] = None):
+    cursor = db.transactions.find(query, {"_id": 0}).sort("data", -1).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for transaction in cursor:
+        batch.append(export_row(transaction))
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            if progress is not None:
+                progress["rows"] += len(batch)
+            yield batch
+            batch = []
+    if batch:
+        if progress is not None:
+            progress["rows"] += len(batch)
+        yield batch
+
+async def export_csv(query: dict, progress: Optional[dict] = None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM lets Excel detect UTF-8 and keep the accents
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_HEADERS)
+    yield buffer.getvalue().encode("utf-8")
+    async for batch in export_batches(query, progress):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+
+async def export_xlsx(query: dict, progress: Optional[dict] = None):
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((XLSX_SHEET_HEADER + xlsx_row(EXPORT_HEADERS)).encode("utf-8"))
+            yield sink.drain()
+            async for batch in export_batches(query, progress):
+                sheet.write("".join(xlsx_row(row) for row in batch).encode("utf-8"))
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+            sheet.write(XLSX_SHEET_FOOTER.encode("utf-8"))
+    yield sink.drain()
+
+EXPORT_WRITERS = {"xlsx": export_xlsx, "csv": export_csv}
+
+# Batch helpers
+# /transactions/batch turns a list of mixed operations into one bulk_write.
+# Without atomic each item succeeds or fails on its own; with atomic the whole
+# batch runs inside a Mongo transaction, which needs a replica set. Updates and
+# deletes only match the version that was read, so a concurrent write turns
+# them into 409s instead of silently skewing the rollups.
+TRANSACTIONS_BATCH_MAX = int(os.environ.get('TRANSACTIONS_BATCH_MAX', '1000'))
+
+class BatchAborted(Exception):
+    pass
+
+def batch_error(index: int, operation: TransactionBatchOperation, status_code: int, message: str) -> dict:
+    return {"index": index, "op": operation.op, "id": operation.id, "status": status_code, "erro": message}
+
+STALE_WRITE = "Registro alterado por outra requisição"
+
+def read_version_filter(user_id: str, before: dict) -> dict:
+    # Only applies to the document as it was read, so the rollup deltas taken
+    # from that pre-image match what was actually written
+    return {"id": before["id"], "user_id": user_id, **version_filter(before.get("version", 0))}
+
+def prepare_batch(user_id: str, operations: List[TransactionBatchOperation], existing: dict) -> tuple:
+    prepared, results = [], {}
+    seen_ids = set()
+    # One stamp for the whole batch, cut to the milliseconds a BSON date keeps,
+    # so each update can be recognised when it is read back
+    stamp = datetime.now(timezone.utc)
+    stamp = stamp.replace(microsecond=stamp.microsecond // 1000 * 1000)
+    for index, operation in enumerate(operations):
+        try:
+            if operation.op == "create":
+                doc = new_transaction_doc(user_id, TransactionCreate(**(operation.data or {})))
+                prepared.append((index, operation, InsertOne(doc), None, doc))
+                continue
+            if operation.op not in ("update", "delete"):
+                results[index] = batch_error(index, operation, 400, "Operação inválida, use create, update ou delete")
+            elif not operation.id:
+                results[index] = batch_error(index, operation, 400, "id obrigatório")
+            elif operation.id in seen_ids:
+                results[index] = batch_error(index, operation, 400, "id repetido no mesmo lote")
+            elif operation.id not in existing:
+                results[index] = batch_error(index, operation, 404, "Transação não encontrada")
+            elif operation.op == "delete":
+                before = existing[operation.id]
+                prepared.append((index, operation, DeleteOne(read_version_filter(user_id, before)), before, None))
+            else:
+                before = existing[operation.id]
+                changes = to_storage(TransactionUpdate(**(operation.data or {})).model_dump(exclude_none=True))
+                version = changes.pop("version", None)
+                if version is not None and version != before.get("version", 0):
+                    results[index] = batch_error(index, operation, 409, STALE_WRITE)
+                elif changes:
+                    if any(field in changes for field in SEARCH_FIELDS):
+                        changes.update(search_fields({**before, **changes}))
+                    update = versioned_update(changes, stamp)
+                    after = {**before, **update["$set"], "version": before.get("version", 0) + 1}
+                    prepared.append((index, operation, UpdateOne(read_version_filter(user_id, before), update), before, after))
+                else:
+                    prepared.append((index, operation, None, before, before))
+            seen_ids.add(operation.id)
+        except ValidationError as e:
+            results[index] = batch_error(index, operation, 422, "; ".join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+            ))
+    return prepared, results
+
+WRITE_ERROR_STATUS = {11000: 409, 121: 422}
+
+def write_error(error: dict) -> tuple:
+    return WRITE_ERROR_STATUS.get(error.get("code"), 500), error["errmsg"]
+
+def batch_write_landed(item: tuple, current: Optional[dict]) -> bool:
+    write, after = item[2], item[4]
+    if isinstance(write, DeleteOne):
+        return current is None
+    return (current is not None and current.get("version") == after["version"]
+            and to_stored_datetime(current["updated_at"]) == after["updated_at"])
+
+async def unordered_batch_write(user_id: str, writes: List[tuple]) -> tuple:
+    try:
+        counts = (await db.transactions.bulk_write([item[2] for item in writes], ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        counts = e.details
+    failed = {writes[error["index"]][0]: write_error(error) for error in counts.get("writeErrors", [])}
+
+    # A bulk result only has totals, so one read of the touched documents
+    # tells which version-guarded writes landed
+    guarded = [item for item in writes if not isinstance(item[2], InsertOne) and item[0] not in failed]
+    current = {}
+    if guarded:
+        async for doc in db.transactions.find(
+            {"user_id": user_id, "id": {"$in": [item[3]["id"] for item in guarded]}},
+            {"_id": 0, "id": 1, "version": 1, "updated_at": 1}
+        ):
+            current[doc["id"]] = doc
+
+    exact = True
+    for kind, reported in ((UpdateOne, counts["nMatched"]), (DeleteOne, counts["nRemoved"])):
+        items = [item for item in guarded if isinstance(item[2], kind)]
+        landed = [item for item in items if reported and batch_write_landed(item, current.get(item[3]["id"]))]
+        # More landings than the server counted means another request changed
+        # or removed the same documents in between; the deltas can't be
+        # trusted then, so the caller recounts the rollups instead
+        exact = exact and len(landed) == reported
+        landed_indexes = {item[0] for item in landed}
+        failed.update({item[0]: (409, STALE_WRITE) for item in items if item[0] not in landed_indexes})
+    return failed, exact
+
+async def resync_rollups(user_id: str):
+    try:
+        await rebuild_rollups(user_id)
+    except PyMongoError:
+        logger.exception("Could not rebuild the rollups of %s after a partial batch", user_id)
+
+async def execute_batch(user_id: str, prepared: List[tuple], results: dict, atomic: bool, session=None):
+    writes = [item for item in prepared if item[2] is not None]
+    guarded = [item for item in writes if not isinstance(item[2], InsertOne)]
+    failed, exact = {}, True
+    if atomic and writes:
+        try:
+            result = await db.transactions.bulk_write([item[2] for item in writes], ordered=True, session=session)
+        except BulkWriteError as e:
+            raise BatchAborted({writes[error["index"]][0]: error["errmsg"] for error in e.details["writeErrors"]})
+        # The pre-images were read in this transaction, so a miss means the
+        # snapshot is inconsistent; abort rather than guess which item it was
+        if result.matched_count + result.deleted_count < len(guarded):
+            raise BatchAborted({item[0]: STALE_WRITE for item in guarded})
+    elif writes:
+        try:
+            failed, exact = await unordered_batch_write(user_id, writes)
+        except PyMongoError:
+            # Part of the batch may already be written; recount so the rollups
+            # and ETags follow whatever landed
+            await resync_rollups(user_id)
+            raise
+
+    added, removed = [], []
+    for index, operation, write, before, after in prepared:
+        if index in failed:
+            results[index] = batch_error(index, operation, *failed[index])
+            continue
+        if write is not None and before is not None:
+            removed.append(before)
+        if write is not None and after is not None:
+            added.append(after)
+        results[index] = {
+            "index": index,
+            "op": operation.op,
+            "id": (after or before)["id"],
+            "status": 200,
+            "transaction": Transaction(**after).model_dump() if after else None
+        }
+
+    if not exact:
+        await resync_rollups(user_id)
+    elif added or removed:
+        await apply_rollup_deltas(user_id, added=added, removed=removed, session=session)
+        await bump_change_counter(user_id, "transactions", session=session)
+
+# Import helpers
+# Uploads are parsed row by row and written in unordered insert_many batches.
+# Every imported row carries a content hash (the nth identical row of a file
+# gets the suffix #n), so importing the same statement twice is a no-op.
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+IMPORT_FORMATS = ("csv", "xlsx", "ofx")
+IMPORT_COLUMNS = {
+    "data": "data",
+    "tipo": "tipo",
+    "categoria": "categoria",
+    "subcategoria": "subcategoria",
+    "descricao": "descricao",
+    "valor": "valor",
+    "payment_method": "payment_method",
+    "forma de pagamento": "payment_method",
+    "is_paid": "is_paid",
+    "pago": "is_paid",
+}
+OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.S | re.I)
+OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+def strip_accents(value: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c))
+
+def parse_amount(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace("R$", "").replace(" ", "").strip()
+    if "," in text:
+        # Brazilian notation: 1.234,56
+        text = text.replace(".", "").replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f"Valor inválido: {value}")
+
+def parse_import_date(value) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()
+    if re.fullmatch(r"\d{2}/\d{2}/\d{4}", text):
+        day, month, year = text.split("/")
+        text = f"{year}-{month}-{day}"
+    try:
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"Data inválida: {value}")
+
+def normalize_import_row(raw: dict, categoria_padrao: str, subcategoria_padrao: str) -> dict:
+    row = {}
+    for column, value in raw.items():
+        field = IMPORT_COLUMNS.get(strip_accents(str(column or "")).strip().lower())
+        if field and value not in (None, ""):
+            row[field] = value.strip() if isinstance(value, str) else value
+
+    if "valor" in row:
+        valor = parse_amount(row["valor"])
+        if "tipo" not in row:
+            row["tipo"] = "saida" if valor < 0 else "entrada"
+        row["valor"] = abs(valor)
+    if "tipo" in row:
+        row["tipo"] = strip_accents(str(row["tipo"])).lower()
+    if "data" in row:
+        row["data"] = parse_import_date(row["data"])
+    if "is_paid" in row and isinstance(row["is_paid"], str):
+        row["is_paid"] = strip_accents(row["is_paid"]).lower() in ("true", "sim", "s", "1", "pago")
+    row.setdefault("categoria", categoria_padrao)
+    row.setdefault("subcategoria", subcategoria_padrao)
+    row.setdefault("descricao", "")
+    return row
+
+def transaction_content_hash(transaction: TransactionCreate) -> str:
+    parts = [
+        transaction.tipo,
+        transaction.categoria,
+        transaction.subcategoria,
+        f"{transaction.valor:.2f}",
+        transaction.descricao,
+        transaction.data,
+        transaction.payment_method or ""
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def read_csv_rows(upload):
+    text = io.TextIOWrapper(upload, encoding="utf-8-sig", errors="replace", newline="")
+    sample = text.readline()
+    delimiter = ";" if sample.count(";") > sample.count(",") else ","
+    reader = csv.DictReader(
+        (line for chunk in ([sample], text) for line in chunk),
+        delimiter=delimiter
+    )
+    for line_number, raw in enumerate(reader, start=2):
+        yield line_number, raw
+
+def read_xlsx_rows(upload):
+    workbook = load_workbook(upload, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = next(rows, None) or ()
+        for line_number, values in enumerate(rows, start=2):
+            if any(value not in (None, "") for value in values):
+                yield line_number, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+def read_ofx_rows(upload):
+    head = upload.read(4096)
+    charset = "cp1252" if re.search(rb"CHARSET:\s*1252|encoding=\"(windows-1252|iso-8859-1)\"", head, re.I) else "utf-8"
+    decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+    buffer = decoder.decode(head)
+    number = 0
+    while True:
+        chunk = upload.read(65536)
+        buffer += decoder.decode(chunk, final=not chunk)
+        last_end = 0
+        for match in OFX_TRANSACTION.finditer(buffer):
+            number += 1
+            fields = {tag.upper(): value.strip() for tag, value in OFX_FIELD.findall(match.group(1))}
+            posted = fields.get("DTPOSTED", "")
+            yield number, {
+                "data": f"{posted[:4]}-{posted[4:6]}-{posted[6:8]}" if len(posted) >= 8 else posted,
+                "valor": fields.get("TRNAMT", ""),
+                "descricao": fields.get("MEMO") or fields.get("NAME", "")
+            }
+            last_end = match.end()
+        buffer = buffer[last_end:]
+        if not chunk:
+            break
+
+IMPORT_READERS = {"csv": read_csv_rows, "xlsx": read_xlsx_rows, "ofx": read_ofx_rows}
+
+async def insert_import_batch(user_id: str, batch: List[tuple], report: dict):
+    hashes = [doc["content_hash"] for _, doc in batch]
+    existing = {
+        doc["content_hash"]
+        async for doc in db.transactions.find(
+            {"user_id": user_id, "content_hash": {"$in": hashes}},
+            {"_id": 0, "content_hash": 1}
+        )
+    }
+    pending = [(line, doc) for line, doc in batch if doc["content_hash"] not in existing]
+    report["duplicadas"] += len(batch) - len(pending)
+    if not pending:
+        return
+
+    failed = {}
+    try:
+        await db.transactions.insert_many([doc for _, doc in pending], ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"]: error for error in e.details["writeErrors"]}
+
+    inserted = []
+    for index, (line, doc) in enumerate(pending):
+        error = failed.get(index)
+        if error is None:
+            inserted.append(doc)
+        elif error["code"] == 11000:
+            # Same row imported concurrently by another request
+            report["duplicadas"] += 1
+        else:
+            add_import_error(report, line, error["errmsg"])
+    report["importadas"] += len(inserted)
+    await apply_rollup_deltas(user_id, added=inserted)
+
+def add_import_error(report: dict, line: int, message: str):
+    report["erros_total"] += 1
+    if len(report["erros"]) < IMPORT_MAX_ERRORS:
+        report["erros"].append({"linha": line, "erro": message})
+
+# Export jobs
+# Large exports run as background jobs: the artifact is written to EXPORT_DIR by
+# a bounded pool of workers and kept for EXPORT_TTL_SECONDS. An identical
+# request is answered with the existing job until the user's transactions change.
+# A queued or running job holds one of the user's EXPORT_JOBS_PER_USER slots,
+# enforced by a unique index so concurrent requests cannot overshoot. Artifacts
+# live on the local disk of the instance that ran the job, so exports assume a
+# single host (any number of workers on it sharing EXPORT_DIR).
+EXPORT_DIR = Path(os.environ.get('EXPORT_DIR', '/tmp/fincontrol-exports'))
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', '2'))
+EXPORT_JOBS_PER_USER = int(os.environ.get('EXPORT_JOBS_PER_USER', '1'))
+EXPORT_TTL_SECONDS = int(os.environ.get('EXPORT_TTL_SECONDS', '3600'))
+EXPORT_JOB_TIMEOUT_SECONDS = int(os.environ.get('EXPORT_JOB_TIMEOUT_SECONDS', '1800'))
+EXPORT_CLEANUP_INTERVAL_SECONDS = int(os.environ.get('EXPORT_CLEANUP_INTERVAL_SECONDS', '300'))
+export_job_slots = asyncio.Semaphore(EXPORT_JOB_WORKERS)
+export_job_tasks = set()
+
+def export_artifact(job: dict) -> Path:
+    return EXPORT_DIR / f"{job['id']}.{job['format']}"
+
+async def run_export_job(job: dict):
+    query = export_query(job["user_id"], **job["filters"])
+    artifact = export_artifact(job)
+    partial = artifact.with_suffix(artifact.suffix + ".part")
+    async with export_job_slots:
+        progress = {"rows": 0, "total": await db.transactions.count_documents(query)}
+        await db.export_jobs.update_one({"id": job["id"]}, {"$set": {"status": "running", "progress": progress}})
+        try:
+            EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+            reported_at = time.monotonic()
+            with open(partial, "wb") as output:
+                async for chunk in EXPORT_WRITERS[job["format"]](query, progress):
+                    output.write(chunk)
+                    if time.monotonic() - reported_at >= 1:
+                        reported_at = time.monotonic()
+                        await db.export_jobs.update_one({"id": job["id"]}, {"$set": {"progress": progress}})
+            partial.rename(artifact)
+            finished_at = datetime.now(timezone.utc)
+            await db.export_jobs.update_one({"id": job["id"]}, {"$unset": {"active_slot": ""}, "$set": {
+                "status": "done",
+                "progress": progress,
+                "size": artifact.stat().st_size,
+                "finished_at": finished_at.isoformat(),
+                "expires_at": (finished_at + timedelta(seconds=EXPORT_TTL_SECONDS)).isoformat()
+            }})
+        except Exception as e:
+            logger.exception("Export job %s failed", job["id"])
+            partial.unlink(missing_ok=True)
+            finished_at = datetime.now(timezone.utc)
+            # Kept as long as a finished export so the client can read the
+            # error, then swept like any other job
+            await db.export_jobs.update_one({"id": job["id"]}, {"$unset": {"active_slot": ""}, "$set": {
+                "status": "failed",
+                "error": str(e),
+                "finished_at": finished_at.isoformat(),
+                "expires_at": (finished_at + timedelta(seconds=EXPORT_TTL_SECONDS)).isoformat()
+            }})
+
+def start_export_job(job: dict):
+    task = asyncio.create_task(run_export_job(job))
+    # Keep a reference so the task is not garbage collected mid-run
+    export_job_tasks.add(task)
+    task.add_done_callback(export_job_tasks.discard)
+
+async def cleanup_export_jobs() -> int:
+    now = datetime.now(timezone.utc)
+    stale_before = (now - timedelta(seconds=EXPORT_JOB_TIMEOUT_SECONDS)).isoformat()
+    await db.export_jobs.update_many(
+        {"status": {"$in": ["queued", "running"]}, "created_at": {"$lt": stale_before}},
+        {"$unset": {"active_slot": ""}, "$set": {"status": "failed", "error": "Tempo limite excedido", "expires_at": now.isoformat()}}
+    )
+
+    expired = await db.export_jobs.find(
+        {"expires_at": {"$lte": now.isoformat()}},
+        {"_id": 0, "id": 1, "format": 1}
+    ).to_list(None)
+    for job in expired:
+        export_artifact(job).unlink(missing_ok=True)
+    if expired:
+        await db.export_jobs.delete_many({"id": {"$in": [job["id"] for job in expired]}})
+    return len(expired)
+
+# Bills window
+# The dashboard count, /analytics/upcoming-bills and the overdue and due-today
+# counts all come from one $facet over the user's open bills, answered by the
+# (user_id, status, vencimento) index. Results are cached per process, keyed on
+# the bills change counter and the date, so they never outlive a write.
+UPCOMING_BILLS_DAYS = int(os.environ.get('UPCOMING_BILLS_DAYS', '7'))
+UPCOMING_BILLS_MAX_DAYS = 366
+BILLS_WINDOW_CACHE_SIZE = int(os.environ.get('BILLS_WINDOW_CACHE_SIZE', '1024'))
+BILLS_WINDOW_CACHE_TTL_SECONDS = int(os.environ.get('BILLS_WINDOW_CACHE_TTL_SECONDS', '300'))
+bills_window_cache = TTLCache(BILLS_WINDOW_CACHE_SIZE, BILLS_WINDOW_CACHE_TTL_SECONDS)
+
+def bills_window_pipeline(user_id: str, today: date, days: int) -> List[dict]:
+    start = to_stored_date(today)
+    tomorrow = to_stored_date(today + timedelta(days=1))
+    # Today plus the next `days` days
+    end = to_stored_date(today + timedelta(days=days + 1))
+    upcoming = {"status": "pendente", "vencimento": {"$gte": start}}
+    # Same rule as the sweep: bills it already flipped count whatever their
+    # date, pending ones it has not reached yet count once past due
+    overdue = {"$or": [{"status": "atrasado"}, {"status": "pendente", "vencimento": {"$lt": start}}]}
+    return [
+        {"$match": {"user_id": user_id, "$or": [
+            {"status": "atrasado"},
+            {"status": "pendente", "vencimento": {"$lt": end}}
+        ]}},
+        {"$facet": {
+            # The limit only bounds the list; the count comes from its own facet
+            "upcoming": [
+                {"$match": upcoming},
+                {"$sort": {"vencimento": 1}},
+                {"$limit": 1000},
+                {"$project": model_projection(Bill)}
+            ],
+            "upcoming_count": [{"$match": upcoming}, {"$count": "count"}],
+            "due_today": [{"$match": {"vencimento": {"$gte": start, "$lt": tomorrow}}}, {"$count": "count"}],
+            "overdue": [{"$match": overdue}, {"$count": "count"}]
+        }}
+    ]
+
+async def bills_window(user_id: str, today: date, days: int = UPCOMING_BILLS_DAYS, bills_version: Optional[int] = None) -> dict:
+    if bills_version is None:
+        bills_version = (await get_change_counters(user_id)).get("bills", 0)
+    key = (user_id, bills_version, today, days)
+    window = bills_window_cache.get(key)
+    if window is not None:
+        return window
+
+    facets = (await db.bills.aggregate(bills_window_pipeline(user_id, today, days)).to_list(1))[0]
+    window = {
+        "days": days,
+        "upcoming": facets["upcoming"],
+        "contas_a_vencer": facets["upcoming_count"][0]["count"] if facets["upcoming_count"] else 0,
+        "contas_vencendo_hoje": facets["due_today"][0]["count"] if facets["due_today"] else 0,
+        "contas_atrasadas": facets["overdue"][0]["count"] if facets["overdue"] else 0
+    }
+    bills_window_cache.set(key, window)
+    return window
+
+# Dashboard helpers
+async def compute_dashboard_stats(user_id: str, today: date, days: int = UPCOMING_BILLS_DAYS,
+                                  counters: Optional[dict] = None) -> DashboardStats:
+    bills_version = counters.get("bills", 0) if counters is not None else None
+    totals, metas_ativas, window = await asyncio.gather(
+        db.user_rollups.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {
+                "_id": None,
+                "entradas_cents": {"$sum": "$entradas_cents"},
+                "saidas_cents": {"$sum": "$saidas_cents"},
+                "count": {"$sum": "$count"}
+            }}
+        ]).to_list(1),
+        db.goals.count_documents({"user_id": user_id}),
+        bills_window(user_id, today, days, bills_version)
+    )
+
+    totals = totals[0] if totals else {}
+    entradas_cents = totals.get("entradas_cents", 0)
+    saidas_cents = totals.get("saidas_cents", 0)
+
+    return DashboardStats(
+        total_entradas=entradas_cents / 100,
+        total_saidas=saidas_cents / 100,
+        saldo=(entradas_cents - saidas_cents) / 100,
+        transacoes_recentes=totals.get("count", 0),
+        metas_ativas=metas_ativas,
+        contas_a_vencer=window["contas_a_vencer"],
+        contas_vencendo_hoje=window["contas_vencendo_hoje"],
+        contas_atrasadas=window["contas_atrasadas"]
+    )
+
+async def dashboard_events(user_id: str, queue: asyncio.Queue):
+    # First a full snapshot, then only the fields each write changed. Starlette
+    # cancels the generator when the client goes away; browsers reconnect on
+    # their own after `retry` ms.
+    try:
+        today = datetime.now(timezone.utc).date()
+        stats = (await compute_dashboard_stats(user_id, today)).model_dump()
+        yield "retry: 5000\n" + sse_event("stats", stats)
+        while True:
+            try:
+                collections = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if datetime.now(timezone.utc).date() == today:
+                    yield ": keepalive\n\n"
+                    continue
+                # Upcoming bills count shifts at midnight without any write
+                collections = {"bills"}
+            while not queue.empty():
+                collections |= queue.get_nowait()
+            today = datetime.now(timezone.utc).date()
+            fresh = (await compute_dashboard_stats(user_id, today)).model_dump()
+            delta = {field: value for field, value in fresh.items() if stats.get(field) != value}
+            stats = fresh
+            yield sse_event("change", {"collections": sorted(collections), "stats": delta})
+    finally:
+        event_broker.unsubscribe(user_id, queue)
+
+# Indexes
+EXPECTED_INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "transactions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("user_id", ASCENDING), ("content_hash", ASCENDING)],
+            name="user_content_hash_unique",
+            unique=True,
+            partialFilterExpression={"content_hash": {"$exists": True}}
+        ),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("tipo", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_tipo_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("categoria", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_categoria_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("payment_method", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_payment_method_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("is_paid", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_is_paid_created_at_id"),
+        # A date range can't precede the created_at sort in the key, so it goes
+        # last: pages still come in index order and rows outside the range are
+        # dropped from the keys without fetching the documents
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING), ("data", ASCENDING)], name="user_created_at_id_data"),
+        # Date-range filters and the /analytics/series $match scan the (user_id,
+        # data) prefix. Not a covered query: the pipeline still fetches each
+        # document because CENTS_EXPR falls back to the legacy $valor field
+        IndexModel([("user_id", ASCENDING), ("data", ASCENDING), ("tipo", ASCENDING), ("valor_cents", ASCENDING)], name="user_data_tipo_valor_cents"),
+        IndexModel([("user_id", ASCENDING), ("search_prefixes", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_search_prefixes_created_at_id"),
+    ],
+    "bills": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("vencimento", ASCENDING)], name="user_vencimento"),
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("vencimento", ASCENDING)], name="user_status_vencimento"),
+        IndexModel([("status", ASCENDING), ("vencimento", ASCENDING)], name="status_vencimento"),
+        IndexModel(
+            [("recurrence_id", ASCENDING), ("vencimento", ASCENDING)],
+            name="recurrence_vencimento_unique",
+            unique=True,
+            partialFilterExpression={"recurrence_id": {"$exists": True}}
+        ),
+    ],
+    "bill_recurrences": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", ASCENDING)], name="user_created_at"),
+        IndexModel([("active", ASCENDING), ("next_vencimento", ASCENDING)], name="active_next_vencimento"),
+    ],
+    "goals": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "user_rollups": [
+        IndexModel([("user_id", ASCENDING), ("month", ASCENDING)], name="user_month_unique", unique=True),
+    ],
+    "change_counters": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "rate_limits": [
+        IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "stream_tickets": [
+        IndexModel([("ticket_hash", ASCENDING)], name="ticket_hash_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "export_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("cache_key", ASCENDING), ("transactions_version", ASCENDING)], name="user_cache_key_version"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at"),
+        IndexModel([("user_id", ASCENDING), ("active_slot", ASCENDING)], name="user_active_slot_unique", unique=True,
+                   partialFilterExpression={"active_slot": {"$exists": True}}),
+    ],
+}
+
+async def ensure_indexes():
+    for collection, models in EXPECTED_INDEXES.items():
+        for model in models:
+            # One index at a time so a conflicting definition or duplicated
+            # data only skips that index instead of the whole collection
+            try:
+                await db[collection].create_indexes([model])
+            except ConnectionFailure:
+                # Unreachable server: every other index would wait out the
+                # same server selection timeout
+                raise
+            except PyMongoError as e:
+                logger.error("Could not create index %s.%s: %s", collection, model.document["name"], e)
+
+async def index_report() -> dict:
+    report = {}
+    for collection, models in EXPECTED_INDEXES.items():
+        live = await db[collection].index_information()
+        expected_names = set()
+        expected = []
+        for model in models:
+            spec = model.document
+            expected_names.add(spec["name"])
+            key = [[field, direction] for field, direction in spec["key"].items()]
+            unique = spec.get("unique", False)
+            current = live.get(spec["name"])
+            expected.append({
+                "name": spec["name"],
+                "key": key,
+                "unique": unique,
+                "present": current is not None,
+                "matches": current is not None
+                    and [[field, direction] for field, direction in current["key"]] == key
+                    and current.get("unique", False) == unique
+            })
+        report[collection] = {
+            "expected": expected,
+            "unexpected": sorted(name for name in live if name != "_id_" and name not in expected_names)
+        }
+    return report
+
 # Auth routes
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
@@ -195,103 +2558,288 @@ async def register(user_data: UserCreate):
         "id": user_id,
         "name": user_data.name,
         "email": user_data.email,
-        "password_hash": hash_password(user_data.password),
+        "password_hash": await hash_password(user_data.password),
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        # A concurrent registration won the race for this email
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
     
-    token = create_access_token({"sub": user_id})
+    token = create_access_token(user_claims(user_doc))
     return {"token": token, "user": {"id": user_id, "name": user_data.name, "email": user_data.email}}
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user["password_hash"]):
+    if not user or not await verify_password(credentials.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
-    token = create_access_token({"sub": user["id"]})
+    token = create_access_token(user_claims(user))
     return {"token": token, "user": {"id": user["id"], "name": user["name"], "email": user["email"]}}
 
 # Dashboard routes
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
-async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find(
-        {"user_id": current_user["id"]}, 
-        {"_id": 0, "valor": 1, "tipo": 1}
-    ).to_list(5000)
-    goals = await db.goals.find({"user_id": current_user["id"]}, {"_id": 0, "id": 1}).to_list(1000)
-    
-    # Get upcoming bills (next 7 days)
+async def get_dashboard_stats(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    days: int = Query(UPCOMING_BILLS_DAYS, ge=0, le=UPCOMING_BILLS_MAX_DAYS)
+):
+    user_id = current_user["id"]
+
     today = datetime.now(timezone.utc).date()
-    next_7_days = today + timedelta(days=7)
-    bills = await db.bills.find({
-        "user_id": current_user["id"],
-        "status": "pendente"
-    }, {"_id": 0}).to_list(1000)
-    
-    upcoming_bills = []
-    for bill in bills:
-        vencimento = datetime.fromisoformat(bill["vencimento"]).date()
-        if today <= vencimento <= next_7_days:
-            upcoming_bills.append(bill)
-    
-    total_entradas = sum(t["valor"] for t in transactions if t["tipo"] == "entrada")
-    total_saidas = sum(t["valor"] for t in transactions if t["tipo"] == "saida")
-    
-    return DashboardStats(
-        total_entradas=total_entradas,
-        total_saidas=total_saidas,
-        saldo=total_entradas - total_saidas,
-        transacoes_recentes=len(transactions),
-        metas_ativas=len(goals),
-        contas_a_vencer=len(upcoming_bills)
+    cached = await not_modified(request, response, user_id, ("transactions", "goals", "bills"), today)
+    if cached:
+        return cached
+
+    return await compute_dashboard_stats(user_id, today, days, request.state.change_counters)
+
+# Event routes
+@api_router.post("/events/ticket")
+async def create_stream_ticket(current_user: dict = Depends(get_current_user)):
+    return {"ticket": await issue_stream_ticket(current_user["id"]), "expires_in": EVENTS_TICKET_TTL_SECONDS}
+
+@api_router.get("/events/stream")
+async def stream_events(ticket: str = Query(...)):
+    user_id = await redeem_stream_ticket(ticket)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Ticket inválido ou expirado")
+    queue = event_broker.subscribe(user_id)
+    if queue is None:
+        raise HTTPException(status_code=429, detail="Muitas conexões de atualização abertas")
+    return StreamingResponse(
+        dashboard_events(user_id, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 # Transaction routes
 @api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions(current_user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find({"user_id": current_user["id"]}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return transactions
+async def get_transactions(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(TRANSACTIONS_PAGE_SIZE, ge=1, le=TRANSACTIONS_MAX_PAGE_SIZE),
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    payment_method: Optional[str] = None,
+    is_paid: Optional[bool] = None,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None
+):
+    cached = await not_modified(request, response, current_user["id"], ("transactions",))
+    if cached:
+        return cached
+    
+    query = {"user_id": current_user["id"]}
+    for field, value in (("tipo", tipo), ("categoria", categoria), ("payment_method", payment_method), ("is_paid", is_paid)):
+        if value is not None:
+            query[field] = value
+    date_range = date_range_query(data_inicio, data_fim)
+    if date_range:
+        query["data"] = date_range
+    if cursor:
+        created_at, transaction_id = decode_cursor(cursor)
+        query["created_at"] = {"$lte": created_at}
+        query["$or"] = [{"created_at": {"$lt": created_at}}, {"id": {"$lt": transaction_id}}]
+    
+    transactions = await db.transactions.find(query, model_projection(Transaction)).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    # The extra row only tells whether another page exists
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(transactions[-1])
+    return fast_json(response, transactions, Transaction)
+
+@api_router.get("/transactions/search", response_model=List[Transaction])
+async def search_transactions(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    q: str = Query(..., min_length=SEARCH_MIN_PREFIX, max_length=200),
+    tipo: Optional[str] = None,
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_CANDIDATES),
+    limit: int = Query(20, ge=1, le=100)
+):
+    words = [word for word in search_words(q) if len(word) >= SEARCH_MIN_PREFIX]
+    if not words:
+        raise HTTPException(status_code=400, detail=f"Informe ao menos uma palavra com {SEARCH_MIN_PREFIX} letras ou mais (artigos e preposições são ignorados)")
+
+    cached = await not_modified(request, response, current_user["id"], ("transactions",))
+    if cached:
+        return cached
+
+    match = {"user_id": current_user["id"]}
+    if tipo:
+        match["tipo"] = tipo
+    rows = await db.transactions.aggregate(search_pipeline(match, words, offset, limit)).to_list(limit + 1)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Offset"] = str(offset + limit)
+    return fast_json(response, rows, Transaction)
 
 @api_router.post("/transactions", response_model=Transaction)
 async def create_transaction(transaction: TransactionCreate, current_user: dict = Depends(get_current_user)):
-    transaction_id = str(uuid.uuid4())
-    transaction_doc = {
-        "id": transaction_id,
-        "user_id": current_user["id"],
-        **transaction.model_dump(),
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
+    transaction_doc = new_transaction_doc(current_user["id"], transaction)
     
     await db.transactions.insert_one(transaction_doc)
+    await apply_rollup_deltas(current_user["id"], added=[transaction_doc])
+    await bump_change_counter(current_user["id"], "transactions")
     return Transaction(**transaction_doc)
 
+async def batch_pre_images(user_id: str, batch: TransactionBatch, session=None) -> dict:
+    ids = [operation.id for operation in batch.operations if operation.op in ("update", "delete") and operation.id]
+    existing = {}
+    if ids:
+        async for doc in db.transactions.find({"user_id": user_id, "id": {"$in": ids}}, {"_id": 0}, session=session):
+            existing[doc["id"]] = doc
+    return existing
+
+@api_router.post("/transactions/batch")
+async def batch_transactions(batch: TransactionBatch, current_user: dict = Depends(get_current_user)):
+    if len(batch.operations) > TRANSACTIONS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo de {TRANSACTIONS_BATCH_MAX} operações por lote")
+    
+    if batch.atomic:
+        try:
+            async with await client.start_session() as session:
+                async with session.start_transaction():
+                    # Read inside the transaction so the pre-images share its snapshot
+                    prepared, results = prepare_batch(current_user["id"], batch.operations,
+                                                      await batch_pre_images(current_user["id"], batch, session))
+                    if results:
+                        raise HTTPException(status_code=400, detail={
+                            "message": "Lote rejeitado, nenhuma operação foi aplicada",
+                            "resultados": sorted(results.values(), key=lambda item: item["index"])
+                        })
+                    await execute_batch(current_user["id"], prepared, results, True, session)
+            publish_change(current_user["id"], "transactions")
+        except BatchAborted as e:
+            raise HTTPException(status_code=409, detail={
+                "message": "Lote rejeitado, nenhuma operação foi aplicada",
+                "resultados": [
+                    batch_error(index, batch.operations[index], 409, message)
+                    for index, message in sorted(e.args[0].items())
+                ]
+            })
+        except OperationFailure as e:
+            if e.code == 20:
+                raise HTTPException(status_code=400, detail="Lotes atômicos exigem MongoDB em replica set")
+            if e.has_error_label("TransientTransactionError"):
+                # A concurrent write touched one of the documents after the transaction read it
+                raise HTTPException(status_code=409, detail=f"Lote rejeitado, nenhuma operação foi aplicada: {STALE_WRITE}")
+            raise
+    else:
+        prepared, results = prepare_batch(current_user["id"], batch.operations,
+                                          await batch_pre_images(current_user["id"], batch))
+        await execute_batch(current_user["id"], prepared, results, False)
+    
+    ordered = [results[index] for index in sorted(results)]
+    succeeded = sum(1 for item in ordered if item["status"] == 200)
+    return {"resultados": ordered, "sucesso": succeeded, "falhas": len(ordered) - succeeded}
+
+@api_router.post("/transactions/import")
+async def import_transactions(
+    file: UploadFile = File(...),
+    current_user: dict = Depends(get_current_user),
+    import_format: Optional[str] = Query(None, alias="format", pattern="^(csv|xlsx|ofx)$"),
+    categoria_padrao: str = "Outros",
+    subcategoria_padrao: str = "Importado"
+):
+    import_format = import_format or Path(file.filename or "").suffix.lstrip(".").lower()
+    if import_format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato inválido, use csv, xlsx ou ofx")
+    
+    report = {"total_linhas": 0, "importadas": 0, "duplicadas": 0, "erros_total": 0, "erros": []}
+    occurrences = {}
+    batch = []
+    try:
+        for line, raw in IMPORT_READERS[import_format](file.file):
+            report["total_linhas"] += 1
+            try:
+                transaction = TransactionCreate(**normalize_import_row(raw, categoria_padrao, subcategoria_padrao))
+            except ValidationError as e:
+                add_import_error(report, line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                continue
+            except ValueError as e:
+                add_import_error(report, line, str(e))
+                continue
+            
+            base_hash = transaction_content_hash(transaction)
+            occurrence = occurrences.get(base_hash, 0)
+            occurrences[base_hash] = occurrence + 1
+            doc = new_transaction_doc(current_user["id"], transaction)
+            doc["content_hash"] = f"{base_hash}#{occurrence}"
+            batch.append((line, doc))
+            
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await insert_import_batch(current_user["id"], batch, report)
+                batch = []
+        if batch:
+            await insert_import_batch(current_user["id"], batch, report)
+    except (zipfile.BadZipFile, InvalidFileException, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Arquivo inválido: {e}")
+    finally:
+        if report["importadas"]:
+            await bump_change_counter(current_user["id"], "transactions")
+    
+    return report
+
 @api_router.delete("/transactions/{transaction_id}")
 async def delete_transaction(transaction_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.transactions.delete_one({"id": transaction_id, "user_id": current_user["id"]})
-    if result.deleted_count == 0:
+    deleted = await db.transactions.find_one_and_delete(
+        {"id": transaction_id, "user_id": current_user["id"]},
+        projection={"_id": 0}
+    )
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Transação não encontrada")
+    await apply_rollup_deltas(current_user["id"], removed=[deleted])
+    await bump_change_counter(current_user["id"], "transactions")
     return {"message": "Transação deletada com sucesso"}
 
 @api_router.put("/transactions/{transaction_id}", response_model=Transaction)
 async def update_transaction(transaction_id: str, transaction_update: TransactionUpdate, current_user: dict = Depends(get_current_user)):
-    existing = await db.transactions.find_one({"id": transaction_id, "user_id": current_user["id"]}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Transação não encontrada")
-    
-    update_data = {k: v for k, v in transaction_update.model_dump().items() if v is not None}
+    update_data = to_storage(transaction_update.model_dump(exclude_none=True))
+    version = update_data.pop("version", None)
     if update_data:
-        await db.transactions.update_one({"id": transaction_id}, {"$set": update_data})
+        update_data["updated_at"] = datetime.now(timezone.utc)
+    # The pre-image is what the rollup deltas need; the result is derived from it
+    existing = await update_owned(
+        db.transactions, transaction_id, current_user["id"], update_data, version,
+        "Transação não encontrada", ReturnDocument.BEFORE
+    )
+    if not update_data:
+        return Transaction(**existing)
     
-    updated = await db.transactions.find_one({"id": transaction_id}, {"_id": 0})
+    updated = {**existing, **update_data, "version": existing.get("version", 0) + 1}
+    if any(field in update_data for field in SEARCH_FIELDS):
+        # The terms need the fields left untouched, known only from the pre-image;
+        # skipped if another edit changed the text since (it indexed its own)
+        await db.transactions.update_one(
+            {"id": transaction_id, **{field: updated.get(field) for field in SEARCH_FIELDS}},
+            {"$set": search_fields(updated)}
+        )
+    if rollup_signature(existing) != rollup_signature(updated):
+        await apply_rollup_deltas(current_user["id"], added=[updated], removed=[existing])
+    # Last, so an ETag or stream event never pairs the new counter with old totals
+    await bump_change_counter(current_user["id"], "transactions")
     return Transaction(**updated)
 
 # Goal routes
 @api_router.get("/goals", response_model=List[Goal])
-async def get_goals(current_user: dict = Depends(get_current_user)):
-    goals = await db.goals.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(1000)
-    return goals
+async def get_goals(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+    cached = await not_modified(request, response, current_user["id"], ("goals",))
+    if cached:
+        return cached
+    
+    goals = await db.goals.find({"user_id": current_user["id"]}, model_projection(Goal)).to_list(1000)
+    return fast_json(response, goals, Goal)
 
 @api_router.post("/goals", response_model=Goal)
 async def create_goal(goal: GoalCreate, current_user: dict = Depends(get_current_user)):
@@ -301,23 +2849,21 @@ async def create_goal(goal: GoalCreate, current_user: dict = Depends(get_current
         "user_id": current_user["id"],
         **goal.model_dump(),
         "valor_atual": 0.0,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "version": 0
     }
     
     await db.goals.insert_one(goal_doc)
+    await bump_change_counter(current_user["id"], "goals")
     return Goal(**goal_doc)
 
 @api_router.put("/goals/{goal_id}", response_model=Goal)
 async def update_goal(goal_id: str, goal_update: GoalUpdate, current_user: dict = Depends(get_current_user)):
-    existing_goal = await db.goals.find_one({"id": goal_id, "user_id": current_user["id"]}, {"_id": 0})
-    if not existing_goal:
-        raise HTTPException(status_code=404, detail="Meta não encontrada")
-    
-    update_data = {k: v for k, v in goal_update.model_dump().items() if v is not None}
+    update_data = goal_update.model_dump(exclude_none=True)
+    version = update_data.pop("version", None)
+    updated_goal = await update_owned(db.goals, goal_id, current_user["id"], update_data, version, "Meta não encontrada")
     if update_data:
-        await db.goals.update_one({"id": goal_id}, {"$set": update_data})
-    
-    updated_goal = await db.goals.find_one({"id": goal_id}, {"_id": 0})
+        await bump_change_counter(current_user["id"], "goals")
     return Goal(**updated_goal)
 
 @api_router.delete("/goals/{goal_id}")
@@ -325,6 +2871,7 @@ async def delete_goal(goal_id: str, current_user: dict = Depends(get_current_use
     result = await db.goals.delete_one({"id": goal_id, "user_id": current_user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Meta não encontrada")
+    await bump_change_counter(current_user["id"], "goals")
     return {"message": "Meta deletada com sucesso"}
 
 # Investment tips routes
@@ -378,120 +2925,203 @@ async def get_investment_tips():
 
 # Bills routes
 @api_router.get("/bills", response_model=List[Bill])
-async def get_bills(current_user: dict = Depends(get_current_user), status: Optional[str] = None):
+async def get_bills(request: Request, response: Response, current_user: dict = Depends(get_current_user), status: Optional[str] = None):
+    today = datetime.now(timezone.utc).date()
+    # Overdue status is derived from today's date, so it is part of the ETag
+    cached = await not_modified(request, response, current_user["id"], ("bills",), today)
+    if cached:
+        return cached
+    
     query = {"user_id": current_user["id"]}
     if status:
-        query["status"] = status
+        query.update(bill_status_query(status, today))
     
-    bills = await db.bills.find(query, {"_id": 0}).sort("vencimento", 1).to_list(1000)
+    bills = await db.bills.find(query, model_projection(Bill)).sort("vencimento", 1).to_list(1000)
     
-    # Auto-update status based on vencimento
-    today = datetime.now(timezone.utc).date()
+    # Overdue bills not yet flipped by the sweep job
     for bill in bills:
-        if bill["status"] == "pendente":
-            vencimento = datetime.fromisoformat(bill["vencimento"]).date()
-            if vencimento < today:
-                bill["status"] = "atrasado"
-                await db.bills.update_one({"id": bill["id"]}, {"$set": {"status": "atrasado"}})
+        if bill["status"] == "pendente" and as_date(bill["vencimento"]) < today:
+            bill["status"] = "atrasado"
     
-    return bills
+    return fast_json(response, bills, Bill)
 
 @api_router.post("/bills", response_model=Bill)
 async def create_bill(bill: BillCreate, current_user: dict = Depends(get_current_user)):
+    if bill.recorrencia:
+        if bill.recorrencia not in RECURRENCE_MONTHS:
+            raise HTTPException(status_code=400, detail="Recorrência inválida, use mensal ou anual")
+        # The rule is stored once; this request only materializes the first
+        # occurrence plus whatever falls between today and the horizon
+        stored = to_storage(bill.model_dump())
+        recurrence = {
+            "id": str(uuid.uuid4()),
+            "user_id": current_user["id"],
+            **stored,
+            "next_occurrence": 0,
+            "next_vencimento": stored["vencimento"],
+            "active": True,
+            "created_at": datetime.now(timezone.utc),
+            "version": 0
+        }
+        await db.bill_recurrences.insert_one(recurrence)
+        today = datetime.now(timezone.utc).date()
+        await materialize_recurrence(recurrence, today, through=0)
+        first = await db.bills.find_one(
+            {"recurrence_id": recurrence["id"], "vencimento": stored["vencimento"]}, {"_id": 0}
+        )
+        return Bill(**first)
+
     bill_id = str(uuid.uuid4())
     bill_doc = {
         "id": bill_id,
         "user_id": current_user["id"],
-        **bill.model_dump(),
+        **to_storage(bill.model_dump()),
         "status": "pendente",
         "data_pagamento": None,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc),
+        "version": 0
     }
     
     await db.bills.insert_one(bill_doc)
+    await bump_change_counter(current_user["id"], "bills")
     return Bill(**bill_doc)
 
 @api_router.put("/bills/{bill_id}", response_model=Bill)
 async def update_bill(bill_id: str, bill_update: BillUpdate, current_user: dict = Depends(get_current_user)):
-    existing = await db.bills.find_one({"id": bill_id, "user_id": current_user["id"]}, {"_id": 0})
-    if not existing:
-        raise HTTPException(status_code=404, detail="Conta não encontrada")
-    
-    update_data = {k: v for k, v in bill_update.model_dump().items() if v is not None}
+    update_data = to_storage(bill_update.model_dump(exclude_none=True))
+    version = update_data.pop("version", None)
     
     # If marking as paid, set payment date
     if update_data.get("status") == "pago" and not update_data.get("data_pagamento"):
-        update_data["data_pagamento"] = datetime.now(timezone.utc).isoformat()
+        update_data["data_pagamento"] = datetime.now(timezone.utc)
     
+    updated = await update_owned(db.bills, bill_id, current_user["id"], update_data, version, "Conta não encontrada")
     if update_data:
-        await db.bills.update_one({"id": bill_id}, {"$set": update_data})
-    
-    updated = await db.bills.find_one({"id": bill_id}, {"_id": 0})
+        await bump_change_counter(current_user["id"], "bills")
+    if updated.get("recurrence_id") and update_data.get("status") == "pago":
+        await roll_recurrence_forward(updated)
     return Bill(**updated)
 
+@api_router.get("/bills/recurrences", response_model=List[BillRecurrence])
+async def get_bill_recurrences(current_user: dict = Depends(get_current_user)):
+    recurrences = await db.bill_recurrences.find(
+        {"user_id": current_user["id"], "active": True}, {"_id": 0}
+    ).sort("created_at", 1).to_list(1000)
+    return recurrences
+
+@api_router.delete("/bills/recurrences/{recurrence_id}")
+async def delete_bill_recurrence(recurrence_id: str, current_user: dict = Depends(get_current_user)):
+    # Stops the schedule; paid and overdue instances stay as history
+    result = await db.bill_recurrences.update_one(
+        {"id": recurrence_id, "user_id": current_user["id"], "active": True},
+        {"$set": {"active": False, "updated_at": datetime.now(timezone.utc)}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Recorrência não encontrada")
+    today = datetime.now(timezone.utc).date()
+    await db.bills.delete_many({
+        "recurrence_id": recurrence_id,
+        "user_id": current_user["id"],
+        "status": "pendente",
+        "vencimento": {"$gte": to_stored_date(today)}
+    })
+    await bump_change_counter(current_user["id"], "bills")
+    return {"message": "Recorrência encerrada com sucesso"}
+
 @api_router.delete("/bills/{bill_id}")
 async def delete_bill(bill_id: str, current_user: dict = Depends(get_current_user)):
     result = await db.bills.delete_one({"id": bill_id, "user_id": current_user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Conta não encontrada")
+    await bump_change_counter(current_user["id"], "bills")
     return {"message": "Conta deletada com sucesso"}
 
 # Analytics routes
 @api_router.get("/analytics/category-breakdown")
 async def get_category_breakdown(current_user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find(
-        {"user_id": current_user["id"], "tipo": "saida"}, 
-        {"_id": 0, "categoria": 1, "valor": 1}
-    ).to_list(5000)
+    rollups = await analytics_db.user_rollups.find(
+        {"user_id": current_user["id"]},
+        {"_id": 0, "categorias.saida": 1}
+    ).to_list(None)
     
     category_totals = {}
-    for t in transactions:
-        cat = t["categoria"]
-        category_totals[cat] = category_totals.get(cat, 0) + t["valor"]
+    for rollup in rollups:
+        for cat, totals in rollup.get("categorias", {}).get("saida", {}).items():
+            current = category_totals.setdefault(_rollup_name(cat), {"total_cents": 0, "count": 0})
+            current["total_cents"] += totals.get("total_cents", 0)
+            current["count"] += totals["count"]
     
-    return [{"categoria": k, "total": v} for k, v in category_totals.items()]
+    return [{"categoria": k, "total": v["total_cents"] / 100} for k, v in category_totals.items() if v["count"] > 0]
 
 @api_router.get("/analytics/monthly-comparison")
 async def get_monthly_comparison(current_user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find(
-        {"user_id": current_user["id"]}, 
-        {"_id": 0, "data": 1, "tipo": 1, "valor": 1}
-    ).to_list(5000)
-    
-    monthly_data = {}
-    for t in transactions:
-        month = t["data"][:7]  # YYYY-MM
-        if month not in monthly_data:
-            monthly_data[month] = {"month": month, "entradas": 0, "saidas": 0}
-        
-        if t["tipo"] == "entrada":
-            monthly_data[month]["entradas"] += t["valor"]
-        else:
-            monthly_data[month]["saidas"] += t["valor"]
+    rollups = await analytics_db.user_rollups.find(
+        {"user_id": current_user["id"], "count": {"$gt": 0}},
+        {"_id": 0, "month": 1, "entradas_cents": 1, "saidas_cents": 1}
+    ).sort("month", 1).to_list(None)
     
-    result = sorted(monthly_data.values(), key=lambda x: x["month"])
-    for item in result:
-        item["saldo"] = item["entradas"] - item["saidas"]
+    result = []
+    for rollup in rollups:
+        entradas = rollup.get("entradas_cents", 0)
+        saidas = rollup.get("saidas_cents", 0)
+        result.append({"month": rollup["month"], "entradas": entradas / 100, "saidas": saidas / 100, "saldo": (entradas - saidas) / 100})
     
     return result
 
-@api_router.get("/analytics/upcoming-bills")
-async def get_upcoming_bills(current_user: dict = Depends(get_current_user)):
-    today = datetime.now(timezone.utc).date()
-    next_7_days = today + timedelta(days=7)
+@api_router.get("/analytics/series")
+async def get_analytics_series(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    granularity: str = "month",
+    data_inicio: Optional[str] = Query(None, alias="from"),
+    data_fim: Optional[str] = Query(None, alias="to"),
+    group_by: Optional[str] = None,
+    tipo: Optional[str] = None
+):
+    if granularity not in SERIES_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity deve ser um de: {', '.join(SERIES_GRANULARITIES)}")
+    if group_by and group_by not in SERIES_GROUP_FIELDS:
+        raise HTTPException(status_code=400, detail=f"group_by deve ser um de: {', '.join(SERIES_GROUP_FIELDS)}")
     
-    bills = await db.bills.find({
-        "user_id": current_user["id"],
-        "status": "pendente"
-    }, {"_id": 0}).to_list(1000)
+    cached = await not_modified(request, response, current_user["id"], ("transactions",))
+    if cached:
+        return cached
     
-    upcoming = []
-    for bill in bills:
-        vencimento = datetime.fromisoformat(bill["vencimento"]).date()
-        if today <= vencimento <= next_7_days:
-            upcoming.append(bill)
+    match = {"user_id": current_user["id"]}
+    date_range = date_range_query(data_inicio, data_fim, ("from", "to"))
+    if date_range:
+        match["data"] = date_range
+    if tipo:
+        match["tipo"] = tipo
     
-    return sorted(upcoming, key=lambda x: x["vencimento"])
+    # Read from the primary: the ETag comes from the primary's change counter,
+    # and a lagging secondary would get stale series cached under a fresh tag
+    buckets = await db.transactions.aggregate(series_pipeline(match, granularity, group_by)).to_list(None)
+    return {
+        "granularity": granularity,
+        "from": data_inicio,
+        "to": data_fim,
+        "group_by": group_by,
+        "series": build_series(buckets)
+    }
+
+@api_router.get("/analytics/upcoming-bills", response_model=List[Bill])
+async def get_upcoming_bills(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    days: int = Query(UPCOMING_BILLS_DAYS, ge=0, le=UPCOMING_BILLS_MAX_DAYS)
+):
+    today = datetime.now(timezone.utc).date()
+    cached = await not_modified(request, response, current_user["id"], ("bills",), today)
+    if cached:
+        return cached
+
+    window = await bills_window(current_user["id"], today, days, request.state.change_counters.get("bills", 0))
+    response.headers["X-Due-Today-Count"] = str(window["contas_vencendo_hoje"])
+    response.headers["X-Overdue-Count"] = str(window["contas_atrasadas"])
+    return fast_json(response, window["upcoming"], Bill)
 
 # Profile routes
 @api_router.get("/profile", response_model=User)
@@ -508,6 +3138,7 @@ async def update_profile(profile_update: ProfileUpdate, current_user: dict = Dep
     update_data = {k: v for k, v in profile_update.model_dump().items() if v is not None}
     if update_data:
         await db.users.update_one({"id": current_user["id"]}, {"$set": update_data})
+        invalidate_cached("users", current_user["id"])
     
     updated_user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0})
     return User(
@@ -519,56 +3150,234 @@ async def update_profile(profile_update: ProfileUpdate, current_user: dict = Dep
 
 # Export route
 @api_router.get("/export/xlsx")
-async def export_to_xlsx(current_user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find(
-        {"user_id": current_user["id"]}, 
-        {"_id": 0}
-    ).sort("data", -1).limit(5000).to_list(5000)
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Transações"
-    
-    headers = ["Data", "Tipo", "Categoria", "Subcategoria", "Descrição", "Valor"]
-    ws.append(headers)
-    
-    for transaction in transactions:
-        ws.append([
-            transaction["data"],
-            transaction["tipo"].upper(),
-            transaction["categoria"],
-            transaction.get("subcategoria", ""),
-            transaction["descricao"],
-            transaction["valor"]
-        ])
-    
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+async def export_to_xlsx(
+    current_user: dict = Depends(get_current_user),
+    export_format: str = Query("xlsx", alias="format", pattern="^(xlsx|csv)$"),
+    tipo: Optional[str] = None,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None
+):
+    query = export_query(current_user["id"], tipo, data_inicio, data_fim)
     
     return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=fincontrol_transacoes.xlsx"}
+        EXPORT_WRITERS[export_format](query),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename=fincontrol_transacoes.{export_format}"}
+    )
+
+@api_router.post("/export/jobs", response_model=ExportJob)
+async def create_export_job(job_request: ExportJobCreate, current_user: dict = Depends(get_current_user)):
+    if job_request.format not in EXPORT_WRITERS:
+        raise HTTPException(status_code=400, detail="Formato inválido, use xlsx ou csv")
+    filters = job_request.model_dump(exclude={"format"})
+    # Validates the dates before anything is enqueued
+    export_query(current_user["id"], **filters)
+    
+    cache_key = hashlib.sha256(json.dumps(job_request.model_dump(), sort_keys=True).encode()).hexdigest()
+    transactions_version = (await get_change_counters(current_user["id"])).get("transactions", 0)
+    
+    # A done job about to be swept would hand out a download that 410s
+    cached = await db.export_jobs.find_one({
+        "user_id": current_user["id"],
+        "cache_key": cache_key,
+        "transactions_version": transactions_version,
+        "$or": [
+            {"status": {"$in": ["queued", "running"]}},
+            {"status": "done", "expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}}
+        ]
+    }, {"_id": 0})
+    if cached and (cached["status"] != "done" or export_artifact(cached).exists()):
+        return ExportJob(**cached, cached=True)
+    
+    job_doc = {
+        "id": str(uuid.uuid4()),
+        "user_id": current_user["id"],
+        "status": "queued",
+        "format": job_request.format,
+        "filters": filters,
+        "cache_key": cache_key,
+        "transactions_version": transactions_version,
+        "progress": {"rows": 0, "total": None},
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    # The first free slot wins; the unique index rejects a slot already taken
+    for slot in range(EXPORT_JOBS_PER_USER):
+        try:
+            await db.export_jobs.insert_one({**job_doc, "active_slot": slot})
+            break
+        except DuplicateKeyError:
+            continue
+    else:
+        raise HTTPException(status_code=429, detail="Limite de exportações simultâneas atingido")
+    start_export_job(job_doc)
+    return ExportJob(**job_doc)
+
+@api_router.get("/export/jobs/{job_id}", response_model=ExportJob)
+async def get_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.export_jobs.find_one({"id": job_id, "user_id": current_user["id"]}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Exportação não encontrada")
+    return ExportJob(**job)
+
+@api_router.get("/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.export_jobs.find_one({"id": job_id, "user_id": current_user["id"]}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Exportação não encontrada")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail="Exportação ainda não concluída")
+    artifact = export_artifact(job)
+    if not artifact.exists():
+        raise HTTPException(status_code=410, detail="Arquivo de exportação expirado")
+    
+    return FileResponse(
+        artifact,
+        media_type=EXPORT_MEDIA_TYPES[job["format"]],
+        filename=f"fincontrol_transacoes.{job['format']}"
     )
 
+# Admin routes
+@api_router.get("/admin/indexes")
+async def get_index_report(admin_user: dict = Depends(get_admin_user)):
+    return await index_report()
+
+@api_router.get("/admin/cache")
+async def get_cache_stats(admin_user: dict = Depends(get_admin_user)):
+    return {
+        "users": {**user_cache.stats(), "jwt_claims_only": AUTH_JWT_CLAIMS_ONLY},
+        "bills_window": bills_window_cache.stats(),
+        "rate_limits": {
+            **rate_limit_store.stats(),
+            "enabled": RATE_LIMIT_ENABLED,
+            "heavy_in_flight": sum(heavy_in_flight.values())
+        }
+    }
+
+@api_router.get("/admin/jobs")
+async def get_job_stats(admin_user: dict = Depends(get_admin_user)):
+    return {
+        "bills_sweep": {**bill_sweep_stats, "interval_seconds": BILLS_SWEEP_INTERVAL_SECONDS},
+        "events": event_broker.stats(),
+        "worker_bus": worker_bus.stats(),
+        "bill_recurrences": {
+            **recurrence_stats,
+            "interval_seconds": RECURRENCE_INTERVAL_SECONDS,
+            "horizon_days": RECURRENCE_HORIZON_DAYS
+        },
+        "password_hashing": {
+            **password_hash_stats,
+            "workers": PASSWORD_HASH_WORKERS,
+            "max_pending": PASSWORD_HASH_MAX_PENDING,
+            "bcrypt_rounds": BCRYPT_ROUNDS
+        }
+    }
+
+# Metrics route
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Health routes
+# /healthz only says the process is serving; /readyz also pings MongoDB, so a
+# load balancer can hold traffic while the database is unreachable
+READYZ_TIMEOUT_SECONDS = float(os.environ.get('READYZ_TIMEOUT_SECONDS', '2'))
+
+@app.get("/healthz", include_in_schema=False)
+async def get_health():
+    return {"status": "ok", "mongo_pool": mongo_pool_listener.stats()}
+
+@app.get("/readyz", include_in_schema=False)
+async def get_readiness():
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READYZ_TIMEOUT_SECONDS)
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        # The details name hosts and topology, so they go to the log only
+        logger.warning("Readiness ping failed: %s", e)
+        return ORJSONResponse(
+            {"status": "unavailable", "error": type(e).__name__, "mongo_pool": mongo_pool_listener.stats()},
+            status_code=503
+        )
+    ping_ms = (time.perf_counter() - started) * 1000
+    metrics.observe("mongo_ping_seconds", "Readiness ping latency", (), ping_ms / 1000)
+    return {"status": "ready", "mongo_ping_ms": round(ping_ms, 2), "mongo_pool": mongo_pool_listener.stats()}
+
 # Include router
 app.include_router(api_router)
 
+# Bodies that are already compressed (XLSX is a zip) are passed through as-is,
+# and so are event streams, which gzip would buffer
+GZIP_SKIP_TYPES = ("application/vnd.openxmlformats", "application/zip", "text/event-stream")
+
+class SelectiveGZipResponder(GZipResponder):
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.start":
+            if Headers(raw=message["headers"]).get("content-type", "").startswith(GZIP_SKIP_TYPES):
+                self.initial_message = message
+                self.content_encoding_set = True
+                return
+        await super().send_with_gzip(message)
+
+class CompressionMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = SelectiveGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+# Innermost, so refusals still get CORS headers and show up in the metrics
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(CompressionMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Next-Offset", "X-Due-Today-Count", "X-Overdue-Count", "Retry-After"],
 )
 
+# Outermost, so latency and sizes cover CORS and compression too
+app.add_middleware(MetricsMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# Under gunicorn the master creates them once before forking (gunicorn.conf.py)
+ENSURE_INDEXES_ON_STARTUP = os.environ.get('ENSURE_INDEXES_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+
+@app.on_event("startup")
+async def create_indexes():
+    if not ENSURE_INDEXES_ON_STARTUP:
+        return
+    try:
+        await ensure_indexes()
+    except PyMongoError as e:
+        logger.error("Index provisioning skipped: %s", e)
+
+background_tasks = []
+
+@app.on_event("startup")
+async def start_background_jobs():
+    mongo_metrics_listener.loop = asyncio.get_running_loop()
+    background_tasks.append(asyncio.create_task(run_periodically(sweep_overdue_bills, BILLS_SWEEP_INTERVAL_SECONDS, leased=True)))
+    background_tasks.append(asyncio.create_task(run_periodically(materialize_recurrences, RECURRENCE_INTERVAL_SECONDS, leased=True)))
+    if WORKER_BUS == "mongo":
+        background_tasks.append(asyncio.create_task(run_periodically(watch_worker_bus, 5)))
+    if EVENTS_CHANGE_STREAMS:
+        background_tasks.append(asyncio.create_task(run_periodically(watch_change_counters, 5)))
+    background_tasks.append(asyncio.create_task(run_periodically(cleanup_export_jobs, EXPORT_CLEANUP_INTERVAL_SECONDS)))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks + list(export_job_tasks):
+        task.cancel()
+    password_hash_executor.shutdown(wait=False)
     client.close()
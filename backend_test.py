@@ -289,6 +289,27 @@ class FinControlAPITester:
             self.log_result("Excel Export", False, None, str(e))
             return False
 
+    def test_import_transactions_csv(self):
+        """Test CSV import and that re-importing the same file is a no-op"""
+        url = f"{self.base_url}/api/transactions/import"
+        headers = {'Authorization': f'Bearer {self.token}'}
+        content = "data;tipo;categoria;subcategoria;descricao;valor\n01/12/2024;saida;Alimentação;Feira;Feira teste;42,50\n"
+        
+        print(f"\n🔍 Testing Transaction Import...")
+        
+        try:
+            reports = []
+            for _ in range(2):
+                files = {'file': ('transacoes.csv', content.encode('utf-8'), 'text/csv')}
+                response = requests.post(url, headers=headers, files=files, timeout=30)
+                reports.append(response.json() if response.status_code == 200 else {})
+            success = reports[0].get('importadas') == 1 and reports[1].get('duplicadas') == 1
+            self.log_result("Transaction Import (CSV)", success, response.status_code, "" if success else str(reports))
+            return success
+        except Exception as e:
+            self.log_result("Transaction Import (CSV)", False, None, str(e))
+            return False
+
     def run_all_tests(self):
         """Run all API tests in sequence"""
         print("🚀 Starting FinControl API Tests")
@@ -307,6 +328,7 @@ class FinControlAPITester:
         self.test_create_transaction_saida()
         self.test_get_transactions()
         self.test_delete_transaction()
+        self.test_import_transactions_csv()
 
         # Goal Tests
         self.test_create_goal()
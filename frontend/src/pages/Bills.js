@@ -66,24 +66,33 @@ const Bills = () => {
     }
   };
 
-  const handleMarkAsPaid = async (billId) => {
+  const handleMarkAsPaid = async (bill) => {
     try {
-      await api.put(`/bills/${billId}`, {
+      await api.put(`/bills/${bill.id}`, {
         status: 'pago',
-        data_pagamento: new Date().toISOString()
+        data_pagamento: new Date().toISOString(),
+        version: bill.version
       });
       toast.success('Conta marcada como paga!');
       fetchBills();
     } catch (error) {
-      toast.error('Erro ao atualizar conta');
+      if (error.response?.status === 409) {
+        toast.error('Conta alterada em outra aba, recarregando');
+        fetchBills();
+      } else {
+        toast.error('Erro ao atualizar conta');
+      }
     }
   };
 
-  const handleDelete = async (id) => {
+  const handleDelete = async (bill) => {
     if (!window.confirm('Deseja realmente excluir esta conta?')) return;
     
     try {
-      await api.delete(`/bills/${id}`);
+      await api.delete(`/bills/${bill.id}`);
+      if (bill.recurrence_id && window.confirm('Encerrar também a recorrência? As próximas contas pendentes serão removidas.')) {
+        await api.delete(`/bills/recurrences/${bill.recurrence_id}`);
+      }
       toast.success('Conta deletada com sucesso!');
       fetchBills();
     } catch (error) {
@@ -218,7 +227,7 @@ const Bills = () => {
                           <div className="flex items-center justify-center gap-2">
                             {bill.status === 'pendente' && (
                               <button
-                                onClick={() => handleMarkAsPaid(bill.id)}
+                                onClick={() => handleMarkAsPaid(bill)}
                                 data-testid={`pay-bill-${index}`}
                                 className="text-[#2CB67D] hover:bg-[#2CB67D]/10 p-2 rounded-lg transition-all"
                                 title="Marcar como pago"
@@ -227,7 +236,7 @@ const Bills = () => {
                               </button>
                             )}
                             <button
-                              onClick={() => handleDelete(bill.id)}
+                              onClick={() => handleDelete(bill)}
                               data-testid={`delete-bill-${index}`}
                               className="text-[#EF4565] hover:bg-[#EF4565]/10 p-2 rounded-lg transition-all"
                             >
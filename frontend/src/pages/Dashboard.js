@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import Navbar from '../components/Navbar';
-import api from '../utils/api';
+import api, { API_URL } from '../utils/api';
 import { TrendingUp, TrendingDown, DollarSign, Activity } from 'lucide-react';
 import { AreaChart, Area, BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts';
 import { motion } from 'framer-motion';
@@ -10,16 +10,19 @@ const Dashboard = () => {
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [stats, setStats] = useState(null);
   const [transactions, setTransactions] = useState([]);
+  const [monthlyData, setMonthlyData] = useState([]);
   const [loading, setLoading] = useState(true);
 
   const fetchDashboardData = useCallback(async () => {
     try {
-      const [statsRes, transactionsRes] = await Promise.all([
+      const [statsRes, transactionsRes, monthlyRes] = await Promise.all([
         api.get('/dashboard/stats'),
-        api.get('/transactions')
+        api.get('/transactions', { params: { limit: 5 } }),
+        api.get('/analytics/monthly-comparison')
       ]);
       setStats(statsRes.data);
       setTransactions(transactionsRes.data);
+      setMonthlyData(monthlyRes.data);
     } catch (error) {
       toast.error('Erro ao carregar dados do dashboard');
     } finally {
@@ -31,21 +34,54 @@ const Dashboard = () => {
     fetchDashboardData();
   }, [fetchDashboardData]);
 
-  const getChartData = () => {
-    const monthlyData = {};
-    transactions.forEach(t => {
-      const month = t.data.substring(0, 7);
-      if (!monthlyData[month]) {
-        monthlyData[month] = { month, entradas: 0, saidas: 0 };
-      }
-      if (t.tipo === 'entrada') {
-        monthlyData[month].entradas += t.valor;
-      } else {
-        monthlyData[month].saidas += t.valor;
+  const refreshLists = useCallback(async () => {
+    try {
+      const [transactionsRes, monthlyRes] = await Promise.all([
+        api.get('/transactions', { params: { limit: 5 } }),
+        api.get('/analytics/monthly-comparison')
+      ]);
+      setTransactions(transactionsRes.data);
+      setMonthlyData(monthlyRes.data);
+    } catch (error) {
+      // The next change event retries
+    }
+  }, []);
+
+  // Live updates: the server pushes only the stats fields that changed
+  useEffect(() => {
+    if (!localStorage.getItem('token') || typeof EventSource === 'undefined') return undefined;
+
+    let source = null;
+    let retry = null;
+    let stopped = false;
+    const connect = async () => {
+      try {
+        // The stream opens with a single-use ticket instead of the JWT in the URL
+        const { data } = await api.post('/events/ticket');
+        if (stopped) return;
+        source = new EventSource(`${API_URL}/events/stream?ticket=${encodeURIComponent(data.ticket)}`);
+        source.addEventListener('stats', (event) => setStats(JSON.parse(event.data)));
+        source.addEventListener('change', (event) => {
+          const { collections, stats: delta } = JSON.parse(event.data);
+          setStats((current) => ({ ...current, ...delta }));
+          if (collections.includes('transactions')) refreshLists();
+        });
+        // The browser's own reconnect reuses the spent ticket and gets closed;
+        // start over with a fresh one
+        source.onerror = () => {
+          if (source.readyState === EventSource.CLOSED && !stopped) retry = setTimeout(connect, 3000);
+        };
+      } catch (error) {
+        if (!stopped) retry = setTimeout(connect, 15000);
       }
-    });
-    return Object.values(monthlyData).sort((a, b) => a.month.localeCompare(b.month));
-  };
+    };
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retry);
+      if (source) source.close();
+    };
+  }, [refreshLists]);
 
   const CustomTooltip = ({ active, payload }) => {
     if (active && payload && payload.length) {
@@ -136,7 +172,7 @@ const Dashboard = () => {
               <div className="bg-[#16161A] border border-white/5 rounded-xl p-6" data-testid="chart-area">
                 <h3 className="text-xl font-bold text-white mb-6">Evolução Mensal</h3>
                 <ResponsiveContainer width="100%" height={300}>
-                  <AreaChart data={getChartData()}>
+                  <AreaChart data={monthlyData}>
                     <defs>
                       <linearGradient id="colorEntradas" x1="0" y1="0" x2="0" y2="1">
                         <stop offset="5%" stopColor="#2CB67D" stopOpacity={0.3}/>
@@ -160,7 +196,7 @@ const Dashboard = () => {
               <div className="bg-[#16161A] border border-white/5 rounded-xl p-6" data-testid="chart-bar">
                 <h3 className="text-xl font-bold text-white mb-6">Comparação Mensal</h3>
                 <ResponsiveContainer width="100%" height={300}>
-                  <BarChart data={getChartData()}>
+                  <BarChart data={monthlyData}>
                     <CartesianGrid strokeDasharray="3 3" stroke="#94A1B2" strokeOpacity={0.1} />
                     <XAxis dataKey="month" stroke="#94A1B2" />
                     <YAxis stroke="#94A1B2" />
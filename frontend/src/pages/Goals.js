@@ -54,7 +54,8 @@ const Goals = () => {
     if (!editingGoal) return;
     try {
       await api.put(`/goals/${editingGoal.id}`, {
-        valor_atual: parseFloat(updateValue)
+        valor_atual: parseFloat(updateValue),
+        version: editingGoal.version
       });
       toast.success('Progresso atualizado!');
       setShowUpdateModal(false);
@@ -62,7 +63,12 @@ const Goals = () => {
       setUpdateValue('');
       fetchGoals();
     } catch (error) {
-      toast.error('Erro ao atualizar progresso');
+      if (error.response?.status === 409) {
+        toast.error('Meta alterada em outra aba, recarregando');
+        fetchGoals();
+      } else {
+        toast.error('Erro ao atualizar progresso');
+      }
     }
   };
 
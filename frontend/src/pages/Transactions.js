@@ -1,13 +1,18 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import Navbar from '../components/Navbar';
 import api from '../utils/api';
-import { Plus, Trash2, Download, Filter } from 'lucide-react';
+import { Plus, Trash2, Download, Filter, Search } from 'lucide-react';
 import { motion } from 'framer-motion';
 import { toast } from 'sonner';
 
 const Transactions = () => {
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [transactions, setTransactions] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [search, setSearch] = useState('');
+  const [query, setQuery] = useState('');
+  const [nextOffset, setNextOffset] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [showModal, setShowModal] = useState(false);
   const [loading, setLoading] = useState(true);
   const [formData, setFormData] = useState({
@@ -42,14 +47,48 @@ const Transactions = () => {
 
   const fetchTransactions = useCallback(async () => {
     try {
-      const response = await api.get('/transactions');
-      setTransactions(response.data);
+      if (query) {
+        const response = await api.get('/transactions/search', { params: { q: query, limit: 50 } });
+        setTransactions(response.data);
+        setNextCursor(null);
+        setNextOffset(response.headers['x-next-offset'] || null);
+      } else {
+        const response = await api.get('/transactions');
+        setTransactions(response.data);
+        setNextCursor(response.headers['x-next-cursor'] || null);
+        setNextOffset(null);
+      }
     } catch (error) {
       toast.error('Erro ao carregar transações');
     } finally {
       setLoading(false);
     }
-  }, []);
+  }, [query]);
+
+  // Searches once typing pauses, from 2 letters on
+  useEffect(() => {
+    const timer = setTimeout(() => setQuery(search.trim().length >= 2 ? search.trim() : ''), 250);
+    return () => clearTimeout(timer);
+  }, [search]);
+
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    try {
+      if (query) {
+        const response = await api.get('/transactions/search', { params: { q: query, limit: 50, offset: nextOffset } });
+        setTransactions((current) => [...current, ...response.data]);
+        setNextOffset(response.headers['x-next-offset'] || null);
+      } else {
+        const response = await api.get('/transactions', { params: { cursor: nextCursor } });
+        setTransactions((current) => [...current, ...response.data]);
+        setNextCursor(response.headers['x-next-cursor'] || null);
+      }
+    } catch (error) {
+      toast.error('Erro ao carregar transações');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   useEffect(() => {
     fetchTransactions();
@@ -169,6 +208,18 @@ const Transactions = () => {
               </div>
             </div>
 
+            <div className="relative mb-6">
+              <Search size={18} className="absolute left-4 top-1/2 -translate-y-1/2 text-[#94A1B2]" />
+              <input
+                type="search"
+                value={search}
+                onChange={(e) => setSearch(e.target.value)}
+                placeholder="Buscar por descrição, categoria ou local"
+                data-testid="transactions-search-input"
+                className="w-full bg-[#242629] border border-white/10 text-white focus:border-[#7F5AF0] focus:ring-1 focus:ring-[#7F5AF0] rounded-lg h-12 pl-11 pr-4 outline-none"
+              />
+            </div>
+
             <div className="bg-[#16161A] border border-white/5 rounded-xl overflow-hidden" data-testid="transactions-table">
               <div className="overflow-x-auto">
                 <table className="w-full">
@@ -224,6 +275,18 @@ const Transactions = () => {
                   </tbody>
                 </table>
               </div>
+              {(nextCursor || nextOffset) && (
+                <div className="flex justify-center py-4 border-t border-white/5">
+                  <button
+                    onClick={handleLoadMore}
+                    disabled={loadingMore}
+                    data-testid="load-more-transactions"
+                    className="text-[#7F5AF0] hover:bg-[#7F5AF0]/10 rounded-lg font-medium px-5 py-2 transition-all disabled:opacity-50"
+                  >
+                    {loadingMore ? 'Carregando...' : 'Carregar mais'}
+                  </button>
+                </div>
+              )}
             </div>
           </motion.div>
         </div>
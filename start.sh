@@ -11,7 +11,8 @@ fi
 # Start Backend
 echo "📦 Starting Backend (FastAPI)..."
 cd /app/backend
-uvicorn server:app --host 0.0.0.0 --port ${PORT:-8001} &
+# gunicorn.conf.py: one uvicorn worker per CPU (WEB_CONCURRENCY overrides)
+PORT=${PORT:-8001} gunicorn server:app &
 BACKEND_PID=$!
 
 # Build Frontend
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+import server
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+USER_ID = "user-1"
+TODAY = date(2026, 3, 10)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mock = mongomock_motor.AsyncMongoMockClient()["fincontrol_test"]
+    monkeypatch.setattr(server, "db", mock)
+    monkeypatch.setattr(server, "bills_window_cache", server.TTLCache(maxsize=16, ttl=60))
+    return mock
+
+
+async def seed_bill(db, offset, status="pendente"):
+    await db.bills.insert_one({
+        "id": f"bill-{offset}-{status}-{await db.bills.count_documents({})}",
+        "user_id": USER_ID,
+        "tipo": "a_pagar",
+        "titulo": "Conta",
+        "valor_cents": 1000,
+        "vencimento": server.to_stored_date(TODAY + timedelta(days=offset)),
+        "categoria": "Moradia",
+        "status": status,
+        "created_at": server.to_stored_datetime("2026-01-01T00:00:00"),
+    })
+
+
+def test_overdue_follows_the_sweep_status(db):
+    async def scenario():
+        await seed_bill(db, 0, status="atrasado")
+        await seed_bill(db, -2, status="atrasado")
+        await seed_bill(db, -1)
+        await seed_bill(db, 0)
+        await seed_bill(db, -5, status="pago")
+        window = await server.bills_window(USER_ID, TODAY, days=7)
+        assert window["contas_atrasadas"] == 3
+        assert window["contas_vencendo_hoje"] == 2
+        assert window["contas_a_vencer"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_upcoming_count_is_not_capped_by_the_list(db, monkeypatch):
+    async def scenario():
+        for _ in range(5):
+            await seed_bill(db, 1)
+        pipeline = server.bills_window_pipeline
+
+        def small_list(user_id, today, days):
+            stages = pipeline(user_id, today, days)
+            for stage in stages[1]["$facet"]["upcoming"]:
+                if "$limit" in stage:
+                    stage["$limit"] = 2
+            return stages
+
+        monkeypatch.setattr(server, "bills_window_pipeline", small_list)
+        window = await server.bills_window(USER_ID, TODAY, days=7)
+        assert len(window["upcoming"]) == 2
+        assert window["contas_a_vencer"] == 5
+
+    asyncio.run(scenario())
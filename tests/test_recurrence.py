@@ -0,0 +1,75 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+import server
+
+
+def rule(vencimento, recorrencia="mensal"):
+    return {"vencimento": vencimento, "recorrencia": recorrencia}
+
+
+@pytest.mark.parametrize("occurrence, expected", [
+    (0, date(2024, 1, 31)),
+    (1, date(2024, 2, 29)),
+    (2, date(2024, 3, 31)),
+    (3, date(2024, 4, 30)),
+    (13, date(2025, 2, 28)),
+    (23, date(2025, 12, 31)),
+])
+def test_monthly_occurrences_clamp_to_month_end(occurrence, expected):
+    assert server.occurrence_date(rule("2024-01-31"), occurrence) == expected
+
+
+def test_month_end_clamp_does_not_drift():
+    # February's 29th must not carry over: March is back on the 30th
+    recurrence = rule("2024-01-30")
+    assert [server.occurrence_date(recurrence, n) for n in range(3)] == [
+        date(2024, 1, 30), date(2024, 2, 29), date(2024, 3, 30)
+    ]
+
+
+def test_yearly_occurrence_of_leap_day():
+    recurrence = rule("2024-02-29", "anual")
+    assert server.occurrence_date(recurrence, 1) == date(2025, 2, 28)
+    assert server.occurrence_date(recurrence, 4) == date(2028, 2, 29)
+
+
+@pytest.mark.parametrize("vencimento, recorrencia, today, expected", [
+    ("2024-01-31", "mensal", date(2026, 10, 17), 33),  # 2026-10-31
+    ("2024-01-31", "mensal", date(2026, 10, 31), 33),
+    ("2024-01-15", "mensal", date(2026, 10, 17), 34),  # 2026-11-15
+    ("2026-12-01", "mensal", date(2026, 10, 17), 0),
+    ("2020-03-10", "anual", date(2026, 10, 17), 7),     # 2027-03-10
+])
+def test_first_occurrence_from(vencimento, recorrencia, today, expected):
+    recurrence = rule(vencimento, recorrencia)
+    first = server.first_occurrence_from(recurrence, today)
+    assert first == expected
+    assert server.occurrence_date(recurrence, first) >= today
+    if first:
+        assert server.occurrence_date(recurrence, first - 1) < today
+
+
+def test_old_anchor_is_not_backfilled(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["fincontrol_test"]
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "RECURRENCE_HORIZON_DAYS", 60)
+
+    async def scenario():
+        recurrence = {
+            "id": "rec-1", "user_id": "user-1", "tipo": "a_pagar", "titulo": "Aluguel",
+            "valor_cents": 150000, "vencimento": server.to_stored_date(date(2024, 1, 31)),
+            "categoria": "Moradia", "recorrencia": "mensal", "next_occurrence": 0, "active": True,
+        }
+        await db.bill_recurrences.insert_one(dict(recurrence))
+        created = await server.materialize_recurrence(recurrence, date(2026, 10, 17), through=0)
+        bills = await db.bills.find({}, {"_id": 0, "occurrence": 1}).sort("occurrence", 1).to_list(None)
+        return created, [bill["occurrence"] for bill in bills]
+
+    created, occurrences = asyncio.run(scenario())
+    # The anchor, then 2026-10-31 and 2026-11-30; 2026-12-31 is past the horizon
+    assert occurrences == [0, 33, 34]
+    assert created == 3
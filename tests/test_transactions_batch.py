@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+import server
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+USER_ID = "user-1"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mock = mongomock_motor.AsyncMongoMockClient()["fincontrol_test"]
+    monkeypatch.setattr(server, "db", mock)
+    return mock
+
+
+async def seed_transaction(db, valor=500.0):
+    doc = server.new_transaction_doc(USER_ID, server.TransactionCreate(
+        tipo="saida", categoria="Moradia", subcategoria="Luz", descricao="Conta de luz",
+        valor=valor, data="2026-01-10", payment_method="pix"
+    ))
+    await db.transactions.insert_one(dict(doc))
+    await server.apply_rollup_deltas(USER_ID, added=[doc])
+    return doc
+
+
+async def saidas_cents(db):
+    rollup = await db.user_rollups.find_one({"user_id": USER_ID, "month": "2026-01"})
+    return rollup["saidas_cents"]
+
+
+async def run_batch_racing(db, operations, concurrent_write):
+    # The concurrent write lands between the batch pre-read and its bulk write
+    batch = server.TransactionBatch(operations=operations)
+    prepared, results = server.prepare_batch(USER_ID, batch.operations, await server.batch_pre_images(USER_ID, batch))
+    await concurrent_write()
+    await server.execute_batch(USER_ID, prepared, results, atomic=False)
+    return results
+
+
+def test_delete_racing_a_concurrent_delete_is_a_conflict(db):
+    async def scenario():
+        doc = await seed_transaction(db)
+
+        async def concurrent_delete():
+            await db.transactions.delete_one({"id": doc["id"]})
+            await server.apply_rollup_deltas(USER_ID, removed=[doc])
+
+        results = await run_batch_racing(db, [{"op": "delete", "id": doc["id"]}], concurrent_delete)
+        assert results[0]["status"] == 409
+        assert await db.transactions.count_documents({}) == 0
+        assert await saidas_cents(db) == 0
+
+    asyncio.run(scenario())
+
+
+def test_update_racing_a_concurrent_update_is_a_conflict(db):
+    async def scenario():
+        doc = await seed_transaction(db)
+
+        async def concurrent_update():
+            await db.transactions.update_one({"id": doc["id"]}, server.versioned_update({"valor_cents": 9900}))
+            await server.apply_rollup_deltas(USER_ID, added=[{**doc, "valor_cents": 9900}], removed=[doc])
+
+        results = await run_batch_racing(db, [{"op": "update", "id": doc["id"], "data": {"valor": 10}}], concurrent_update)
+        assert results[0]["status"] == 409
+        stored = await db.transactions.find_one({"id": doc["id"]})
+        assert stored["valor_cents"] == 9900
+        assert await saidas_cents(db) == 9900
+
+    asyncio.run(scenario())
+
+
+def test_unraced_operations_still_apply(db):
+    async def scenario():
+        first = await seed_transaction(db, valor=100.0)
+        second = await seed_transaction(db, valor=200.0)
+
+        async def nothing():
+            pass
+
+        results = await run_batch_racing(db, [
+            {"op": "update", "id": first["id"], "data": {"valor": 150}},
+            {"op": "delete", "id": second["id"]},
+        ], nothing)
+        assert [results[index]["status"] for index in sorted(results)] == [200, 200]
+        assert await saidas_cents(db) == 15000
+
+    asyncio.run(scenario())
+
+
+def test_write_errors_keep_their_own_status():
+    assert server.write_error({"code": 11000, "errmsg": "duplicate key"}) == (409, "duplicate key")
+    assert server.write_error({"code": 121, "errmsg": "Document failed validation"}) == (422, "Document failed validation")
+    assert server.write_error({"code": 2, "errmsg": "bad value"}) == (500, "bad value")
+
+
+def test_partially_raced_deletes_recount_the_rollups(db, monkeypatch):
+    # compute_rollups needs $convert, which mongomock lacks; only check that
+    # the recount replaces the untrustworthy deltas
+    rebuilt = []
+
+    async def fake_rebuild(user_id=None):
+        rebuilt.append(user_id)
+        return []
+
+    monkeypatch.setattr(server, "rebuild_rollups", fake_rebuild)
+
+    async def scenario():
+        first = await seed_transaction(db, valor=100.0)
+        second = await seed_transaction(db, valor=200.0)
+
+        async def concurrent_delete_without_rollups():
+            await db.transactions.delete_one({"id": first["id"]})
+
+        results = await run_batch_racing(db, [
+            {"op": "delete", "id": first["id"]},
+            {"op": "delete", "id": second["id"]},
+        ], concurrent_delete_without_rollups)
+        assert await db.transactions.count_documents({}) == 0
+        assert rebuilt == [USER_ID]
+        assert await saidas_cents(db) == first["valor_cents"] + second["valor_cents"]
+        assert {results[index]["status"] for index in results} <= {200, 409}
+
+    asyncio.run(scenario())